@@ -22,35 +22,18 @@ extern "C"
 typedef double real_t;
 typedef int index_t;
 
+namespace
+{
+// Computes the un-normalized weights for handles [first_column, first_column+num_columns)
+// into the #V by num_columns matrix 'W'.
 // Returns 0 for success, anything else is an error.
-int bbw(
-    /// Input Parameters
-    // 'vertices' is a pointer to num_vertices*kVertexDimension floating point values,
-    // packed: x0, y0, z0, x1, y1, z1, ...
-    // In other words, a num_vertices-by-kVertexDimension matrix packed row-major.
+int bbw_column_range(
     int num_vertices, real_t* vertices,
-    // 'faces' is a pointer to num_faces*3 integers,
-    // where each face is three vertex indices: f0.v0, f0.v1, f0.v2, f1.v0, f1.v1, f1.v2, ...
-    // Face i's vertices are: vertices[ faces[3*i]*2 ], vertices[ faces[3*i+1]*2 ], vertices[ faces[3*i+2]*2 ]
-    // In other words, a num_faces-by-3 matrix packed row-major.
     int num_faces, index_t* faces,
-    // 'skeleton_vertices' is a pointer to num_skeleton_vertices*kVertexDimension floating point values,
-    // packed the same way as 'vertices' (NOTE: And whose positions must also exist inside 'vertices'.)
     int num_skeleton_vertices, real_t* skeleton_vertices,
-    // 'skeleton_point_handles' is a pointer to num_skeleton_point_handles integers,
-    // where each element "i" in skeleton_point_handles references the vertex whose data
-    // is located at skeleton_vertices[ skeleton_point_handles[i]*kVertexDimension ].
     int num_skeleton_point_handles, index_t* skeleton_point_handles,
-    // TODO: Take skeleton bone edges and cage edges
-    
-    /// Output Parameters
-    // 'Wout' is a pointer to num_vertices*num_skeleton_vertices values.
-    // Upon return, W will be filled with each vertex in 'num_vertices' weight for
-    // each skeleton vertex in 'num_skeleton_vertices'.
-    // The data layout is that all 'num_skeleton_vertices' weights for vertex 0
-    // appear before all 'num_skeleton_vertices' weights for vertex 1, and so on.
-    // In other words, a num_vertices-by-num_skeleton_vertices matrix packed row-major.
-    real_t* Wout
+    int first_column, int num_columns,
+    Eigen::MatrixXd& W
     )
 {
     using namespace std;
@@ -69,8 +52,6 @@ int bbw(
     assert( num_skeleton_point_handles > 0 );
     assert( skeleton_point_handles );
     
-    assert( Wout );
-    
     // #V by 2 list of mesh vertex positions
     // Make this an Eigen::map from 'vertices'
     MatrixXd V = Eigen::Map< Eigen::Matrix< real_t, Eigen::Dynamic, kVertexDimension, Eigen::RowMajor > >( vertices, num_vertices, kVertexDimension );
@@ -102,16 +83,73 @@ int bbw(
         return 1;
     }
     
+    if( first_column < 0 || num_columns <= 0 || first_column + num_columns > bc.cols() )
+    {
+        return 3;
+    }
+    
     // compute BBW 
+    // Each weight function is solved for independently, so we only
+    // need to pass the boundary conditions of the ones we want.
     // Default bbw data and flags
     BBWData bbw_data;
-    // Weights matrix
-    MatrixXd W;
-    if(!bbw(V,F,b,bc,bbw_data,W))
+    MatrixXd bc_columns = bc.middleCols( first_column, num_columns );
+    if(!bbw(V,F,b,bc_columns,bbw_data,W))
     {
         return 2;
     }
     
+    return 0;
+}
+}
+
+// Returns 0 for success, anything else is an error.
+int bbw(
+    /// Input Parameters
+    // 'vertices' is a pointer to num_vertices*kVertexDimension floating point values,
+    // packed: x0, y0, z0, x1, y1, z1, ...
+    // In other words, a num_vertices-by-kVertexDimension matrix packed row-major.
+    int num_vertices, real_t* vertices,
+    // 'faces' is a pointer to num_faces*3 integers,
+    // where each face is three vertex indices: f0.v0, f0.v1, f0.v2, f1.v0, f1.v1, f1.v2, ...
+    // Face i's vertices are: vertices[ faces[3*i]*2 ], vertices[ faces[3*i+1]*2 ], vertices[ faces[3*i+2]*2 ]
+    // In other words, a num_faces-by-3 matrix packed row-major.
+    int num_faces, index_t* faces,
+    // 'skeleton_vertices' is a pointer to num_skeleton_vertices*kVertexDimension floating point values,
+    // packed the same way as 'vertices' (NOTE: And whose positions must also exist inside 'vertices'.)
+    int num_skeleton_vertices, real_t* skeleton_vertices,
+    // 'skeleton_point_handles' is a pointer to num_skeleton_point_handles integers,
+    // where each element "i" in skeleton_point_handles references the vertex whose data
+    // is located at skeleton_vertices[ skeleton_point_handles[i]*kVertexDimension ].
+    int num_skeleton_point_handles, index_t* skeleton_point_handles,
+    // TODO: Take skeleton bone edges and cage edges
+    
+    /// Output Parameters
+    // 'Wout' is a pointer to num_vertices*num_skeleton_vertices values.
+    // Upon return, W will be filled with each vertex in 'num_vertices' weight for
+    // each skeleton vertex in 'num_skeleton_vertices'.
+    // The data layout is that all 'num_skeleton_vertices' weights for vertex 0
+    // appear before all 'num_skeleton_vertices' weights for vertex 1, and so on.
+    // In other words, a num_vertices-by-num_skeleton_vertices matrix packed row-major.
+    real_t* Wout
+    )
+{
+    using namespace igl;
+    using namespace Eigen;
+    
+    assert( Wout );
+    
+    // Weights matrix
+    MatrixXd W;
+    const int result = bbw_column_range(
+        num_vertices, vertices, num_faces, faces,
+        num_skeleton_vertices, skeleton_vertices,
+        num_skeleton_point_handles, skeleton_point_handles,
+        0, num_skeleton_vertices,
+        W
+        );
+    if( result != 0 ) return result;
+    
     // Normalize weights.
     normalize_row_sums(W,W);
     
@@ -122,4 +160,43 @@ int bbw(
     return 0;
 }
 
+// Returns 0 for success, anything else is an error.
+int bbw_columns(
+    /// Input Parameters
+    // The same as bbw().
+    int num_vertices, real_t* vertices,
+    int num_faces, index_t* faces,
+    int num_skeleton_vertices, real_t* skeleton_vertices,
+    int num_skeleton_point_handles, index_t* skeleton_point_handles,
+    // Only the weights for skeleton vertices
+    // first_column, first_column+1, ..., first_column+num_columns-1 are computed.
+    int first_column, int num_columns,
+    
+    /// Output Parameters
+    // 'Wout' is a pointer to num_vertices*num_columns values.
+    // Upon return, W will be filled with each vertex in 'num_vertices' weight for
+    // each of the 'num_columns' skeleton vertices, packed row-major like bbw()'s.
+    // NOTE: Unlike bbw(), the weights are not normalized, since that needs all of them.
+    real_t* Wout
+    )
+{
+    using namespace Eigen;
+    
+    assert( Wout );
+    
+    MatrixXd W;
+    const int result = bbw_column_range(
+        num_vertices, vertices, num_faces, faces,
+        num_skeleton_vertices, skeleton_vertices,
+        num_skeleton_point_handles, skeleton_point_handles,
+        first_column, num_columns,
+        W
+        );
+    if( result != 0 ) return result;
+    
+    Eigen::Map< Eigen::Matrix< real_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor > >( Wout, num_vertices, num_columns ) = W;
+    
+    return 0;
+}
+
 }
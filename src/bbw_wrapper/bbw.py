@@ -58,6 +58,17 @@ g++ -fPIC \
     -shared -o bbw.so \
     -g -O2 -Wall -Wshadow -Wno-sign-compare
 
+# Linux, Debian/Ubuntu's Eigen (libeigen3-dev).
+# bbw() calls bbw_columns() from a pool of threads, so this uses every core without OpenMP.
+g++ -fPIC \
+    bbw.cpp mvc.cpp harmonic.cpp \
+    -I../libigl/include \
+    -I/usr/include/eigen3 \
+    -I/usr/include/eigen3/unsupported \
+    -shared -o bbw.so \
+    -DNDEBUG \
+    -O3 -Wall -Wshadow -Wno-sign-compare
+
 # Cygwin?
 g++ -fPIC \
     bbw.cpp mvc.cpp \
@@ -104,6 +115,26 @@ int bbw(
     real_t* Wout
     );
 
+// Returns 0 for success, anything else is an error.
+int bbw_columns(
+    /// Input Parameters
+    // The same as bbw().
+    int num_vertices, real_t* vertices,
+    int num_faces, index_t* faces,
+    int num_skeleton_vertices, real_t* skeleton_vertices,
+    int num_skeleton_point_handles, index_t* skeleton_point_handles,
+    // Only the weights for skeleton vertices
+    // first_column, first_column+1, ..., first_column+num_columns-1 are computed.
+    int first_column, int num_columns,
+    
+    /// Output Parameters
+    // 'Wout' is a pointer to num_vertices*num_columns values.
+    // Upon return, W will be filled with each vertex in 'num_vertices' weight for
+    // each of the 'num_columns' skeleton vertices, packed row-major like bbw()'s.
+    // NOTE: Unlike bbw(), the weights are not normalized, since that needs all of them.
+    real_t* Wout
+    );
+
 // Returns 0 for success, anything else is an error.
 int mvc(
     /// Input Parameters
@@ -172,7 +203,7 @@ libbbw = ffi.dlopen( os.path.join( os.path.dirname( __file__ ), 'bbw' + platform
 
 class BBWError( Exception ): pass
 
-def bbw( vertices, faces, skeleton_handle_vertices, skeleton_point_handles ):
+def bbw( vertices, faces, skeleton_handle_vertices, skeleton_point_handles, num_threads = 1, column_seconds = None ):
     '''
     Given an N-by-(2 or 3) numpy array 'vertices' of 2D or 3D vertices,
     an M-by-3 numpy array 'faces' of indices into 'vertices',
@@ -181,6 +212,10 @@ def bbw( vertices, faces, skeleton_handle_vertices, skeleton_point_handles ):
     which are the point handles,
     returns a N-by-H numpy.array of weights per vertex per handle.
     
+    If 'num_threads' is greater than 1 (or None, for one per CPU), each handle's weights are solved
+    for with a separate call on a pool of that many threads (cffi releases the GIL during each call).
+    If the optional list 'column_seconds' is given, it is filled with how long each handle's weights took.
+    
     NOTE: All the vertices in 'skeleton_handle_vertices' must also exist in 'vertices'.
     '''
     
@@ -218,6 +253,22 @@ def bbw( vertices, faces, skeleton_handle_vertices, skeleton_point_handles ):
     assert len( skeleton_point_handles.shape ) == 1
     assert len( skeleton_point_handles ) == len( set( skeleton_point_handles ) )
     
+    if num_threads is None:
+        import multiprocessing
+        num_threads = multiprocessing.cpu_count()
+    
+    ## Libraries built before bbw_columns() was added can only solve for all handles at once.
+    try:
+        libbbw.bbw_columns
+    except AttributeError:
+        num_threads = 1
+    
+    if num_threads > 1 and len( skeleton_handle_vertices ) > 1:
+        return bbw_by_column( vertices, faces, skeleton_handle_vertices, skeleton_point_handles, num_threads, column_seconds )
+    
+    import time
+    duration = time.time()
+    
     Wout = numpy.empty( ( len( vertices ), len( skeleton_handle_vertices ) ), dtype = real_t )
 #     debugger()
     result = libbbw.bbw(
@@ -231,6 +282,57 @@ def bbw( vertices, faces, skeleton_handle_vertices, skeleton_point_handles ):
     if result != 0:
         raise BBWError( 'bbw() reported an error' )
     
+    if column_seconds is not None:
+        duration = time.time() - duration
+        column_seconds[:] = [ duration / len( skeleton_handle_vertices ) ] * len( skeleton_handle_vertices )
+    
+    return Wout
+
+def bbw_by_column( vertices, faces, skeleton_handle_vertices, skeleton_point_handles, num_threads, column_seconds = None ):
+    '''
+    The same as bbw(), for arrays already converted by it,
+    but solves for each handle's weights with a separate call to libbbw.bbw_columns()
+    on a pool of 'num_threads' threads, and then normalizes them.
+    '''
+    
+    import numpy, time
+    from multiprocessing.pool import ThreadPool
+    
+    def solve_column( column ):
+        duration = time.time()
+        
+        Wcolumn = numpy.empty( len( vertices ), dtype = real_t )
+        result = libbbw.bbw_columns(
+            len( vertices ),                 ffi.cast( 'real_t*',  vertices.ctypes.data ),
+            len( faces ),                    ffi.cast( 'index_t*', faces.ctypes.data ),
+            len( skeleton_handle_vertices ), ffi.cast( 'real_t*',  skeleton_handle_vertices.ctypes.data ),
+            len( skeleton_point_handles ),   ffi.cast( 'index_t*', skeleton_point_handles.ctypes.data ),
+            column, 1,
+            
+            ffi.cast( 'real_t*', Wcolumn.ctypes.data )
+            )
+        
+        return result, Wcolumn, time.time() - duration
+    
+    pool = ThreadPool( min( num_threads, len( skeleton_handle_vertices ) ) )
+    try:
+        columns = pool.map( solve_column, range( len( skeleton_handle_vertices ) ) )
+    finally:
+        pool.close()
+    
+    if any([ result != 0 for result, Wcolumn, seconds in columns ]):
+        raise BBWError( 'bbw_columns() reported an error' )
+    
+    if column_seconds is not None:
+        column_seconds[:] = [ seconds for result, Wcolumn, seconds in columns ]
+    
+    Wout = numpy.empty( ( len( vertices ), len( skeleton_handle_vertices ) ), dtype = real_t )
+    for column, ( result, Wcolumn, seconds ) in enumerate( columns ):
+        Wout[ :, column ] = Wcolumn
+    
+    ## Normalize weights, as bbw() does.
+    Wout /= Wout.sum( axis = 1 )[ :, numpy.newaxis ]
+    
     return Wout
 
 def harmonic( vertices, faces, boundary_indices, power ):
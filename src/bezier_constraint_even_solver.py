@@ -38,7 +38,10 @@ class BezierConstraintSolverEven( BezierConstraintSolver ):
 		## UPDATE 4: I tried it and it makes no difference to performance at all
 		##           up to alec's alligator. So, we'll reset the symbolic factorization
 		##           in case the initial configuration has zeros.
-		self.system_symbolic_factored = None
+		## UPDATE 5: The symbolic factorization is kept for as long as the structural
+		##           fingerprint of the system stays the same (see factor_system()).
+		##           Block systems keep zero-valued lagrange entries, so their pattern
+		##           doesn't change here.
 		
 	
 	def solve( self ):
@@ -48,16 +51,7 @@ class BezierConstraintSolverEven( BezierConstraintSolver ):
 		dofs_per_bundle = self.dofs_per_bundle
 		dirs_per_bundle = [bundle.directions for bundle in self.bundles]
 		# num = len( dofs_per_bundle )
-		if self.system_symbolic_factored is None:
-			#print 'even symbolic factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_symbolic_factored = self.compute_symbolic_factorization( system )
-			self.system_factored = self.system_symbolic_factored( system )
-		
-		elif self.system_factored is None:
-			#print 'even numeric factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_factored = self.system_symbolic_factored( system )
+		self.factor_system()
 		
 		#print 'even solve'
 		x = self.system_factored( self.rhs )
@@ -221,245 +215,99 @@ class BezierConstraintSolverEven( BezierConstraintSolver ):
 		
 		
 	def system_for_curve( self, bundle ):
-		dofs = self.compute_dofs_per_curve(bundle)
-		dirs = asarray(bundle.directions)
-		length = bundle.length
-		
-		def analytical_matrices():
-			if array_equal(dofs, (4,4)):
-				Left = [[1./7, 0., 1./14, 0., 1./35, 0., 1./140, 0.],
-						[0., 1./7, 0., 1./14, 0., 1./35, 0., 1./140],
-						[1./14, 0., 3./35, 0., 9./140, 0., 1./35, 0.],
-						[0., 1./14, 0., 3./35, 0., 9./140, 0., 1./35],
-						[1./35, 0., 9./140, 0., 3./35, 0., 1./14, 0.],
-						[0., 1./35, 0., 9./140, 0., 3./35, 0., 1./14],
-						[1./140, 0., 1./35, 0., 1./14, 0., 1./7, 0.],
-						[0., 1./140, 0., 1./35, 0., 1./14, 0., 1./7]]
-			## p1x, p1y, s, p3x, p3y, p4x, p4y
-			elif array_equal(dofs, (3,4)):
-				Left = [[13./35, 0., 11./70*dirs[0,0], 13./140, 0., 1./28, 0.],
-						[0., 13./35, 11./70*dirs[0,1], 0., 13./140, 0., 1./28],
-						[11./70*dirs[0,0], 11./70*dirs[0,1], 3./35*mag2(dirs[0]), 9./140*dirs[0,0], 9./140*dirs[0,1], 1./35*dirs[0,0], 1./35*dirs[0,1]],
-						[13./140, 0., 9./140*dirs[0,0], 3./35, 0., 1./14, 0.],
-						[0., 13./140, 9./140*dirs[0,1], 0., 3./35, 0., 1./14],
-						[1./28, 0., 1./35*dirs[0,0], 1./14, 0., 1./7, 0.],
-						[0., 1./28, 1./35*dirs[0,1], 0., 1./14, 0., 1./7]]	
-			## p1x, p1y, p2x, p2y, p4x, p4y, u
-			elif array_equal(dofs, (4,3)):
-				Left = [[1./7, 0., 1./14, 0., 1./28, 0., 1./35*dirs[1,0]],
-						[0., 1./7, 0., 1./14, 0., 1./28, 1./35*dirs[1,1]],
-						[1./14, 0., 3./35, 0., 13./140, 0., 9./140*dirs[1,0]],
-						[0., 1./14, 0., 3./35, 0., 13./140, 9./140*dirs[1,1]],
-						[1./28, 0., 13./140, 0., 13./35, 0., 11./70*dirs[1,0]],
-						[0., 1./28, 0., 13./140, 0., 13./35, 11./70*dirs[1,1]],
-						[1./35*dirs[1,0], 1./35*dirs[1,1], 9./140*dirs[1,0], 9./140*dirs[1,1], 11./70*dirs[1,0], 11./70*dirs[1,1], 3./35*mag2(dirs[1])]]	
-			## p1x, p1y, s, p4x, p4y, u
-			elif array_equal(dofs, (3,3)):
-				Left = [[13./35, 0., 11./70*dirs[0,0], 9./70, 0., 13./140*dirs[1,0]],
-						[0., 13./35, 11./70*dirs[0,1], 0., 9./70, 13./140*dirs[1,1]],
-						[11./70*dirs[0,0], 11./70*dirs[0,1], 3./35*mag2(dirs[0]), 13./140*dirs[0,0], 13./140*dirs[0,1], 9./140*dot(dirs[0], dirs[1])],
-						[9./70, 0., 13./140*dirs[0,0], 13./35, 0., 11./70*dirs[1,0]],
-						[0., 9./70, 13./140*dirs[0,1], 0., 13./35, 11./70*dirs[1,1]],
-						[13./140*dirs[1,0], 13./140*dirs[1,1], 9./140*dot(dirs[0], dirs[1]), 22./140*dirs[1,0], 22./140*dirs[1,1], 3./35*mag2(dirs[1])]]
-					
-			return Left			
-		
-		Lefts = self.get_default_left_matrices_for_even_iterations()
-		## p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y
-		if array_equal(dofs, (4,4)):
-			Left = Lefts[0]
-			
-		## p1x, p1y, s, p3x, p3y, p4x, p4y
-		elif array_equal(dofs, (3,4)):
-			Left = Lefts[1]
-			Left[ 3: : 2, 2 ] *= dirs[0,0]
-			Left[ 4: : 2, 2 ] *= dirs[0,1]
-			Left[0,2] *= dirs[0,0]
-			Left[1,2] *= dirs[0,1]
-			Left[2,2] *= mag2(dirs[0])
-			Left[2] = Left[:, 2]
-			
-		## p1x, p1y, p2x, p2y, p4x, p4y, u
-		elif array_equal(dofs, (4,3)):
-			Left = Lefts[2]
-			Left[ :6 : 2, -1 ] *= dirs[1,0]
-			Left[ 1:6 : 2, -1 ] *= dirs[1,1]
-			Left[ -1, -1 ] *= mag2(dirs[1])
-			Left[ -1 ] = Left[ :, -1 ]
-	
-		## p1x, p1y, s, p4x, p4y, u
-		elif array_equal(dofs, (3,3)):
-			Left = Lefts[3]
-			Left[ 0, 2 ] *= dirs[0,0]
-			Left[ 1, 2 ] *= dirs[0,1]
-			Left[ 0, 5 ] *= dirs[1,0]
-			Left[ 1, 5 ] *= dirs[1,1]
-			Left[ 2, 2 ] *= mag2(dirs[0])
-			Left[ 2, 5 ] *= dot(dirs[0], dirs[1])
-			
-			Left[ 3, 2 ] *= dirs[0,0]
-			Left[ 4, 2 ] *= dirs[0,1]
-			Left[ 3, 5 ] *= dirs[1,0]
-			Left[ 4, 5 ] *= dirs[1,1]
-			Left[ 5, 2 ] *= dot(dirs[0], dirs[1])
-			Left[ 5, 5 ] *= mag2(dirs[1])
-			
-			Left[ 2 ] = Left[ :, 2 ]
-			Left[ 5 ] = Left[ :, 5 ]
-					
-		else:
-			raise RuntimeError('bundle return wrong dofs.')
-		
-# 		Left_ref = analytical_matrices()
-
-		return asarray( Left )*length
-		
+		return self.assemble_systems_for_curves( self.prepare_systems_for_curves( [ bundle ], False ), [ bundle ] )[0]
 	
 	def system_for_curve_with_arc_length( self, bundle ):
 		'''
 		## Solve the same integral as system__for_curve only with dt replaced by ds
 		'''
-		ts = bundle.ts
-  		dts = bundle.dts
-		dim = 2
-		
-		dofs = self.compute_dofs_per_curve(bundle)
-		dirs = asarray(bundle.directions)
-		length = bundle.length
+		return self.assemble_systems_for_curves( self.prepare_systems_for_curves( [ bundle ], True ), [ bundle ] )[0]
+	
+	def systems_for_curves( self ):
+		'''
+		Returns the system of every bundle in self.bundles, assembled for all of them at once.
+		The parts that don't depend on the directions are prepared the first time and kept.
+		'''
+		if self.curve_system_parts is None:
+			self.curve_system_parts = self.prepare_systems_for_curves( self.bundles, self.kArcLength )
 		
-		if array_equal(dofs, (4,4)):
+		return self.assemble_systems_for_curves( self.curve_system_parts, self.bundles )
+	
+	def prepare_systems_for_curves( self, bundles, kArcLength ):
+		'''
+		Given a sequence of bundles and whether to integrate with respect to arc length,
+		returns the parts of their systems that don't depend on their directions,
+		for assemble_systems_for_curves().
+		
+		The system of a curve is dot( T.T, dot( K, T ) ), where K is its MAM
+		with x and y interleaved times its length, and T maps the curve's dofs to its
+		interleaved control point coordinates p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y.
+		When a curve's first (last) direction is fixed, p2 = p1 + s*dirs[0] (p3 = p4 + u*dirs[1]),
+		so the only entries of T that change between iterations are the directions in the column of s (u).
+		For the closed form of each system, see get_default_left_matrices_for_even_iterations().
+		'''
+		num = len( bundles )
+		sizes = zeros( num, dtype = int )
+		Ks = zeros( ( num, 8, 8 ) )
+		Ts = zeros( ( num, 8, 8 ) )
+		## The column of s and of u in T, or -1 for the curves without one.
+		s_columns = -ones( num, dtype = int )
+		u_columns = -ones( num, dtype = int )
+		
+		for i, bundle in enumerate( bundles ):
+			dofs = self.compute_dofs_per_curve(bundle)
+			sizes[i] = sum( dofs )
 			
-			tbar = ones( ( 4, 1 ) )
-			MAM = zeros( ( 4, 4 ) )
-			for i in range(len(dts)):
-				t = (ts[i] + ts[i+1])/2
-				ds = dts[i]
-		
-				tbar[0] = t**3
-				tbar[1] = t**2
-				tbar[2] = t
-		
-				Mtbar = dot( M.T, tbar )
-				MAM += dot( Mtbar, Mtbar.T )*ds
+			MAM = bundle.arc_length_MAM() if kArcLength else self.get_MAM( bundle )
+			Ks[i] = kron( MAM, identity( 2 ) )*bundle.length
 			
-			Left = zeros( ( 8, 8 ) )	
-			Left[ : : 2, : : 2 ] = MAM
-			Left[ 1: : 2, 1: : 2 ] = MAM
-			print 'arc length 4*4', Left	
-
-		## p1x, p1y, s, p3x, p3y, p4x, p4y
-		elif array_equal(dofs, (3,4)):
-			Left = zeros( ( 7,  7 ) )
+			## p1x, p1y
+			Ts[ i, 0, 0 ] = Ts[ i, 1, 1 ] = 1.
+			## p2x, p2y
+			if dofs[0] == 4:
+				Ts[ i, 2, 2 ] = Ts[ i, 3, 3 ] = 1.
+			## s
+			elif dofs[0] == 3:
+				Ts[ i, 2, 0 ] = Ts[ i, 3, 1 ] = 1.
+				s_columns[i] = 2
+			else:
+				raise RuntimeError('bundle return wrong dofs.')
 			
-			coefs = zeros( 4 )
-			for i in range(len(dts)):
-				temp = zeros( ( 7,  7 ) )
-				t = (ts[i] + ts[i+1])/2
-				ds = dts[i]
+			offset = dofs[0]
+			## p3x, p3y, p4x, p4y
+			if dofs[1] == 4:
+				Ts[ i, 4, offset ] = Ts[ i, 5, offset+1 ] = 1.
+				Ts[ i, 6, offset+2 ] = Ts[ i, 7, offset+3 ] = 1.
+			## p4x, p4y, u
+			elif dofs[1] == 3:
+				Ts[ i, 4, offset ] = Ts[ i, 5, offset+1 ] = 1.
+				Ts[ i, 6, offset ] = Ts[ i, 7, offset+1 ] = 1.
+				u_columns[i] = offset+2
+			else:
+				raise RuntimeError('bundle return wrong dofs.')
 		
-				coefs[0] = 2*t**3 - 3*t**2 + 1
-				coefs[1] = 3*( t**3 - 2*t**2 + t )
-				coefs[2] = -3*( t**3 - t**2 )
-				coefs[3] = t**3
-			
-				## top half
-				temp[0,0] = temp[1,1] = coefs[0]
-				temp[0,2] = coefs[1] * dirs[0,0]
-				temp[1,2] = coefs[1] * dirs[0,1]
-				temp[0,3] = temp[1,4] = coefs[2]
-				temp[0,5] = temp[1,6] = coefs[3]			
-				temp[2] = temp[0] * coefs[1] * dirs[0,0] + temp[1] * coefs[1] * dirs[0,1]
-				temp[0] = temp[0] * coefs[0]
-				temp[1] = temp[1] * coefs[0]
-				## bottom half
-				temp[3,0] = temp[4,1] = temp[5,0] = temp[6,1] = coefs[0]
-				temp[3,2] = temp[5,2] = coefs[1] * dirs[0,0]
-				temp[4,2] = temp[6,2] = coefs[1] * dirs[0,1]
-				temp[3,3] = temp[4,4] = temp[5,3] = temp[6,4] = coefs[2]				
-				temp[3,5] = temp[4,6] = temp[5,5] = temp[6,6] = coefs[3]
-				temp[3:5] *= coefs[2]
-				temp[5:7] *= coefs[3]
-				
-				Left = Left + temp * ds
-
-						
-		## p1x, p1y, p2x, p2y, p4x, p4y, u
-		elif array_equal(dofs, (4,3)):
-			Left = zeros( ( 7,  7 ) )
-			
-			coefs = zeros( 4 )
-			for i in range(len(dts)):
-				temp = zeros( ( 7,  7 ) )
-				t = (ts[i] + ts[i+1])/2
-				ds = dts[i]
+		return sizes, Ks, Ts, s_columns, u_columns
+	
+	def assemble_systems_for_curves( self, parts, bundles ):
+		'''
+		Given the 'parts' returned by prepare_systems_for_curves() for 'bundles',
+		returns the system of each bundle for its current directions.
+		'''
+		sizes, Ks, Ts, s_columns, u_columns = parts
+		dirs = asarray( [ bundle.directions for bundle in bundles ], dtype = float )
 		
-				coefs[0] = t**3 - 3*t**2 + 3*t - 1
-				coefs[1] = -3*( t**3 - 2*t**2 + t )
-				coefs[2] = 2*t**3 - 3*t**2
-				coefs[3] = 3*( t**3 - t**2 )
-			
-				## top half
-				temp[0,0] = temp[1,1] = temp[2,0] = temp[3,1] = coefs[0]
-				temp[0,2] = temp[1,3] = temp[2,2] = temp[3,3] = coefs[1]				
-				temp[0,4] = temp[1,5] = temp[2,4] = temp[3,5] = coefs[2]
-				temp[0,6] = temp[2,6] = coefs[3] * dirs[1,0]
-				temp[1,6] = temp[3,6] = coefs[3] * dirs[1,1]
-				temp[0:2] *= coefs[0]
-				temp[2:4] *= coefs[1]
-				## bottom half
-				temp[4,0] = temp[5,1] = coefs[0]
-				temp[4,2] = temp[5,3] = coefs[1]
-				temp[4,4] = temp[5,5] = coefs[2]
-				temp[4,6] = coefs[3] * dirs[1,0]
-				temp[5,6] = coefs[3] * dirs[1,1]		
-				temp[6] = temp[4] * coefs[3] * dirs[1,0] + temp[5] * coefs[3] * dirs[1,1]
-				temp[4] = temp[4] * coefs[2]
-				temp[5] = temp[5] * coefs[2]
-				
-				Left = Left + temp * ds
-					
-		## p1x, p1y, s, p4x, p4y, u
-		elif array_equal(dofs, (3,3)):
-			Left = zeros( ( 6,  6 ) )
-			
-			coefs = zeros( 4 )
-			for i in range(len(dts)):
-				temp = zeros( ( 6,  6 ) )
-				t = (ts[i] + ts[i+1])/2
-				ds = dts[i]
+		Ts = Ts.copy()
+		with_s = where( s_columns >= 0 )[0]
+		Ts[ with_s, 2, s_columns[ with_s ] ] = dirs[ with_s, 0, 0 ]
+		Ts[ with_s, 3, s_columns[ with_s ] ] = dirs[ with_s, 0, 1 ]
+		with_u = where( u_columns >= 0 )[0]
+		Ts[ with_u, 4, u_columns[ with_u ] ] = dirs[ with_u, 1, 0 ]
+		Ts[ with_u, 5, u_columns[ with_u ] ] = dirs[ with_u, 1, 1 ]
 		
-				coefs[0] = -( 2*t**3 - 3*t**2 + 1 )
-				coefs[1] = 2*t**3 - 3*t**2
-				coefs[2] = -3*( t**3 - 2*t**2 + t )
-				coefs[3] = 3*( t**3 - t**2 )
-			
-				## top half
-				temp[0,0] = temp[1,1] = coefs[0]
-				temp[0,2] = coefs[2] * dirs[0,0]
-				temp[1,2] = coefs[2] * dirs[0,1]
-				temp[0,3] = temp[1,4] = coefs[1]
-				temp[0,5] = coefs[3] * dirs[1,0]
-				temp[1,5] = coefs[3] * dirs[1,1]
-				temp[2] = temp[0] * coefs[2] * dirs[0,0] + temp[1] * coefs[2] * dirs[0,1]
-				temp[0] = temp[0] * coefs[0]
-				temp[1] = temp[1] * coefs[0]
-				## bottom half
-				temp[3,0] = temp[4,1] = coefs[0]
-				temp[3,2] = coefs[2] * dirs[0,0]
-				temp[4,2] = coefs[2] * dirs[0,1]
-				temp[3,3] = temp[4,4] = coefs[1]
-				temp[3,5] = coefs[3] * dirs[1,0]
-				temp[4,5] = coefs[3] * dirs[1,1]
-				temp[5] = temp[3] * coefs[3] * dirs[1,0] + temp[4] * coefs[3] * dirs[1,1]
-				temp[3] = temp[3] * coefs[1]
-				temp[4] = temp[4] * coefs[1]
-				
-				Left = Left + temp * ds
-					
-		else:
-			raise RuntimeError('bundle return wrong dofs.')
+		## Lefts[i] = dot( Ts[i].T, dot( Ks[i], Ts[i] ) )
+		Lefts = matmul( Ts.transpose( 0, 2, 1 ), matmul( Ks, Ts ) )
 		
-		return Left*length
+		return [ Left[ :size, :size ] for Left, size in zip( Lefts, sizes ) ]
 		
 	def compute_dofs_per_curve( self, bundle ):
 		dofs = zeros( 2, dtype = int )
@@ -505,16 +353,9 @@ class BezierConstraintSolverEven( BezierConstraintSolver ):
 		dofs = self.compute_dofs_per_curve(bundle)
 		Right = zeros( sum(dofs) )
 		
-		controls = asarray(bundle.control_points)
 		dirs = asarray(bundle.directions)
-		temp = zeros( (3, 4) )
-		
-		for i in range( len( transforms ) ):
-
-			T_i = mat( asarray(transforms[i]).reshape(3, 3) )
- 			W_i = asarray(W_matrices[i])
-			
-			temp = temp + dot(asarray(T_i*(controls.T)*M), W_i)
+		## sum(Ti * P.T * M * W_i), updated only for the handles that changed.
+		temp = bundle.transformed_controls( transforms )
 		R = temp[:2,:]
 		
 		## p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y
@@ -39,7 +39,10 @@ class BezierConstraintSolverOdd( BezierConstraintSolver ):
 		## UPDATE 4: I tried it and it makes no difference to performance at all
 		##           up to alec's alligator. So, we'll reset the symbolic factorization
 		##           in case the initial configuration has zeros.
-		self.system_symbolic_factored = None
+		## UPDATE 5: The symbolic factorization is kept for as long as the structural
+		##           fingerprint of the system stays the same (see factor_system()).
+		##           Block systems keep zero-valued lagrange entries, so their pattern
+		##           doesn't change here.
 		
 		
 	
@@ -50,16 +53,7 @@ class BezierConstraintSolverOdd( BezierConstraintSolver ):
 		#print 'rhs:'
 		#print self.rhs.tolist()
 		
-		if self.system_symbolic_factored is None:
-			#print 'odd symbolic factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_symbolic_factored = self.compute_symbolic_factorization( system )
-			self.system_factored = self.system_symbolic_factored( system )
-		
-		elif self.system_factored is None:
-			#print 'odd numeric factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_factored = self.system_symbolic_factored( system )
+		self.factor_system()
 		
 		#print 'odd solve'
 		x = self.system_factored( self.rhs )
@@ -229,7 +223,7 @@ class BezierConstraintSolverOdd( BezierConstraintSolver ):
 		## MAM is computed using Sage. MAM = M * A * M
 		'''
 		length = bundle.length
-		MAM = asarray( self.MAM )
+		MAM = asarray( self.get_MAM( bundle ) )
 		
 		dim = 2
 		Left = zeros((8, 8))
@@ -243,30 +237,17 @@ class BezierConstraintSolverOdd( BezierConstraintSolver ):
 		'''
 		## Solve the same integral as system__for_curve only with dt replaced by ds
 		'''
-		length = bundle.length
-		ts = bundle.ts
-		dts = bundle.dts
-		dim = 2
-		Left = zeros( ( 8, 8 ) )
-		tbar = ones( ( 4, 1 ) )
-		MAM = zeros( ( 4, 4 ) )
-		
-		for i in range(len(dts)):
-			t = (ts[i] + ts[i+1])/2
-			ds = dts[i]
-			
-			tbar[0] = t*t*t
-			tbar[1] = t*t
-			tbar[2] = t
+		## It doesn't depend on the directions or magnitudes, so it is only built once per bundle.
+		if bundle.arc_length_systems is None:
+			MAM = bundle.arc_length_MAM()
+			dim = 2
+			Left = zeros( ( 8, 8 ) )
+			for i in range( dim ):
+				Left[ i*4:( i+1 )*4, i*4:( i+1 )*4 ] = MAM[:,:]
 			
-			Mtbar = dot( M.T, tbar )
-
-			MAM += dot( Mtbar, Mtbar.T )*ds
-	
-		for i in range( dim ):		
-			Left[ i*4:( i+1 )*4, i*4:( i+1 )*4 ] = MAM[:,:]
+			bundle.arc_length_systems = Left*bundle.length
 		
-		return Left*length
+		return bundle.arc_length_systems
 			
 			
 	def compute_dofs_per_curve( self, bundle ):
@@ -325,17 +306,9 @@ class BezierConstraintSolverOdd( BezierConstraintSolver ):
 # 		Right = asarray(Right).reshape(-1)
 # 		Right = Right[:8]	
 
-		W_matrices = bundle.W_matrices
-		controls = bundle.control_points
-		
 		Right = zeros( 8 )
-		temp = zeros( (3, 4) )
-		for i in range( len( transforms ) ):
-		
-			T_i = mat( asarray(transforms[i]).reshape(3, 3) )
-			W_i = asarray(W_matrices[i])
-
-			temp = temp + dot(asarray(T_i*(controls.T)*M), W_i)
+		## sum(Ti * P.T * M * W_i), updated only for the handles that changed.
+		temp = bundle.transformed_controls( transforms )
 
 		R = temp[:2,:]
 		
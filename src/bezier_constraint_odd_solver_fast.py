@@ -61,6 +61,7 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 			
 			### 4
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs + dofs_next ] = small_lagrange_system
+			system[ dof_offset : dof_offset + dofs + dofs_next, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 			rhs[ :, constraint_equation_offset : constraint_equation_offset + constraint_eqs, 9 ] = small_lagrange_rhs
 	
 			dof_offset += dofs
@@ -77,6 +78,8 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 			### 4
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs  ] = small_lagrange_system[ :, :dofs ]
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, : dofs_next ] = small_lagrange_system[ :, dofs: ]
+			system[ dof_offset : dof_offset + dofs, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system[ :, :dofs ].T
+			system[ : dofs_next, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system[ :, dofs: ].T
 			rhs[ :, constraint_equation_offset : constraint_equation_offset + constraint_eqs, 9 ] = small_lagrange_rhs
 			constraint_equation_offset += constraint_eqs
 			
@@ -88,18 +91,20 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 			if lambdas_per_joint[-1] == 2:
 				small_lagrange_system, small_lagrange_rhs = self.lagrange_equations_for_fixed_opening( bundles[-1], is_head = False )
 				system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs_tail  ] = small_lagrange_system
+				system[ dof_offset : dof_offset + dofs_tail, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 				rhs[ :, constraint_equation_offset : constraint_equation_offset + constraint_eqs, 9 ] = small_lagrange_rhs
 				constraint_equation_offset += constraint_eqs
 				
 			if lambdas_per_joint[0] == 2:
 				small_lagrange_system, small_lagrange_rhs = self.lagrange_equations_for_fixed_opening( bundles[0], is_head = True )							
 				system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs_tail  ] = small_lagrange_system
+				system[ dof_offset : dof_offset + dofs_tail, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 				rhs[ :, constraint_equation_offset : constraint_equation_offset + constraint_eqs, 9 ] = small_lagrange_rhs
 				constraint_equation_offset += constraint_eqs
 				
 				
-		## Set the upper-right portion of the system matrix, too
-		system[ : total_dofs, total_dofs : ] = system.T[ : total_dofs, total_dofs : ]
+		## The upper-right portion of the system matrix is set along with each lagrange block above,
+		## rather than with system.T, so that sparse and block system types never touch the whole matrix.
 		
 		# self.system	 = self.to_system_solve_t( system )
 		## Reset system_factored, but leave 'self.system_symbolic_factorization' alone,
@@ -160,45 +165,60 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 		## UPDATE 4: I tried it and it makes no difference to performance at all
 		##			 up to alec's alligator. So, we'll reset the symbolic factorization
 		##			 in case the initial configuration has zeros.
-		self.system_symbolic_factored = None
+		## UPDATE 5: The symbolic factorization is kept for as long as the structural
+		##           fingerprint of the system stays the same (see factor_system()).
+		##           Block systems keep zero-valued lagrange entries, so their pattern
+		##           doesn't change here.
 		self.Os = None
 		
 	
+	def update_Os( self ):
+		'''
+		Makes sure self.Os is up-to-date with the system and its right-hand-sides.
+		self.Os[i] is the total_dofs-by-10 matrix for handle i, such that
+		the solution is the sum over handles of self.Os[i] * [ vec(T_i), 1 ].
+		'''
+		if self.factor_system():
+			self.Os = None
+		
+		if self.Os is None:
+			## Back-substitute every handle's right-hand-sides at once,
+			## as the columns of one system_size-by-( handles * 10 ) matrix.
+			num_handles, system_size, num_columns = self.rhs.shape
+			rhs = self.rhs.transpose( 1, 0, 2 ).reshape( system_size, num_handles * num_columns )
+			solved = self.system_factored( rhs )
+			self.Os = ascontiguousarray( solved[ :self.total_dofs ].reshape( self.total_dofs, num_handles, num_columns ).transpose( 1, 0, 2 ) )
+	
+	def linear_basis( self ):
+		'''
+		Returns a ( num_curves * 4 * 2 )-by-( handles * 10 ) matrix B such that
+		dot( B, concatenate( [ append( T_i.ravel(), 1. ) for each handle i ] ) ).reshape( num_curves, 4, 2 )
+		are the control points that solve() returns for the handle transforms T_i.
+		The matrix is only valid until the system changes.
+		'''
+		if parameters.kClampOn:
+			raise RuntimeError( "The solution is not linear in the transforms when clamping." )
+		
+		self.update_Os()
+		num = len( self.bundles )
+		## Curve i's dofs are dim rows of 4 control point coordinates,
+		## so the x or y coordinate c of control point j is dof ( i*dim + c )*4 + j.
+		i, j, c = indices( ( num, 4, 2 ) )
+		rows = ( ( i*dim + c )*4 + j ).ravel()
+		num_handles, total_dofs, num_columns = self.Os.shape
+		return self.Os[ :, rows, : ].transpose( 1, 0, 2 ).reshape( len( rows ), num_handles * num_columns )
+	
 	def solve( self ):
 		num = len(self.bundles)
 		
 		#print 'rhs:'
 		#print self.rhs.tolist()
 		
-		if self.system_symbolic_factored is None:
-			#print 'odd symbolic factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_symbolic_factored = self.compute_symbolic_factorization( system )
-			self.system_factored = self.system_symbolic_factored( system )
-			self.Os = None
-		
-		elif self.system_factored is None:
-			#print 'odd numeric factoring'
-			system = self.to_system_solve_t( self.system )
-			self.system_factored = self.system_symbolic_factored( system )
-			self.Os = None
+		self.update_Os()
 		
-		if self.Os is None:
-			self.Os = []
-			for i in xrange(len( self.Ts )):
-				## Doesn't take a matrix:
-				# self.Os.append( self.system_factored( self.rhs[i] ) )
-				
-				solved = zeros( self.rhs[i].shape )
-				for j in xrange( self.rhs[i].shape[1] ):
-					solved[:,j] = self.system_factored( self.rhs[i,:,j] )
-				self.Os.append( solved[:self.total_dofs,:] )
-		
-		x = zeros( self.total_dofs )
-		for i in xrange(len( self.Ts )):
-			T = self.Ts[i]
-			O = self.Os[i]
-			x += dot( O, append( T.ravel(), 1. ) )
+		## Each handle contributes O_i * [ vec(T_i), 1 ].
+		Ts = asarray( self.Ts ).reshape( len( self.Ts ), 9 )
+		x = einsum( 'hdk,hk->d', self.Os, concatenate( ( Ts, ones( ( len( Ts ), 1 ) ) ), axis = 1 ) )
 		#x = x[:2,:]
 		
 		#print 'odd solve'
@@ -377,7 +397,7 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 		## MAM is computed using Sage. MAM = M * A * M
 		'''
 		length = bundle.length
-		MAM = asarray( self.MAM )
+		MAM = asarray( self.get_MAM( bundle ) )
 		
 		Left = zeros((4*dim, 4*dim))
 
@@ -390,29 +410,16 @@ class BezierConstraintSolverOddFast( BezierConstraintSolver ):
 		'''
 		## Solve the same integral as system__for_curve only with dt replaced by ds
 		'''
-		length = bundle.length
-		ts = bundle.ts
-		dts = bundle.dts
-		Left = zeros( ( 4*dim, 4*dim ) )
-		tbar = ones( ( 4, 1 ) )
-		MAM = zeros( ( 4, 4 ) )
-		
-		for i in range(len(dts)):
-			t = (ts[i] + ts[i+1])/2
-			ds = dts[i]
-			
-			tbar[0] = t*t*t
-			tbar[1] = t*t
-			tbar[2] = t
+		## It doesn't depend on the directions or magnitudes, so it is only built once per bundle.
+		if bundle.arc_length_systems is None:
+			MAM = bundle.arc_length_MAM()
+			Left = zeros( ( 4*dim, 4*dim ) )
+			for i in range( dim ):
+				Left[ i*4:( i+1 )*4, i*4:( i+1 )*4 ] = MAM[:,:]
 			
-			Mtbar = dot( M.T, tbar )
-
-			MAM += dot( Mtbar, Mtbar.T )*ds
-	
-		for i in range( dim ):		
-			Left[ i*4:( i+1 )*4, i*4:( i+1 )*4 ] = MAM[:,:]
+			bundle.arc_length_systems = Left*bundle.length
 		
-		return Left*length
+		return bundle.arc_length_systems
 			
 			
 	def compute_dofs_per_curve( self, bundle ):
@@ -9,14 +9,145 @@ kEps = 1e-7
 ## The bezier curve's coefficient matrix, P(t) = tbar*M*P
 M = matrix('-1. 3. -3. 1.; 3. -6. 3. 0.; -3. 3. 0. 0.; 1. 0. 0. 0.') 
 
-def sample_cubic_bezier_curve_chain( Cset, num_samples = 100 ):
+def cubic_bezier_basis( ts ):
+	'''
+	Given a length-S sequence of t values 'ts',
+	returns an S-by-4 numpy.array whose rows are tbar*M for each t,
+	so that the points of a bezier curve with 4-by-k control points P are dot( cubic_bezier_basis( ts ), P ).
+	'''
+	ts = asarray( ts, dtype = float )
+	tbars = array( [ ts**3, ts**2, ts, ones( ts.shape ) ] ).T
+	return dot( tbars, asarray( M ) )
+
+def cubic_bezier_derivative_basis( ts ):
+	'''
+	Given a length-S sequence of t values 'ts',
+	returns an S-by-4 numpy.array whose rows are d(tbar)/dt*M for each t,
+	so that the derivatives of a bezier curve with 4-by-k control points P are dot( cubic_bezier_derivative_basis( ts ), P ).
+	'''
+	ts = asarray( ts, dtype = float )
+	dtbars = array( [ 3*ts**2, 2*ts, ones( ts.shape ), zeros( ts.shape ) ] ).T
+	return dot( dtbars, asarray( M ) )
+
+def gauss_legendre_ts( num_points ):
+	'''
+	Given a positive integer 'num_points',
+	returns ( ts, dts ), the 'num_points' Gauss-Legendre points on [0,1] with 0 and 1 added at either end,
+	and the quadrature weight of each (0 for 0 and 1), which sum to 1.
+	
+	With at least 4 points, the quadrature is exact for the polynomials up to degree 7
+	in the W_i and MAM integrals.
+	'''
+	from numpy.polynomial.legendre import leggauss
+	
+	nodes, weights = leggauss( num_points )
+	ts = concatenate( ( [0.], .5*( nodes + 1. ), [1.] ) )
+	dts = concatenate( ( [0.], .5*weights, [0.] ) )
+	return ts, dts
+
+def quadrature_points( ts, dts ):
+	'''
+	Given the t values 'ts' of the samples of a curve and their 'dts', which have
+	either one entry per pair of consecutive samples (the midpoint rule)
+	or one entry per sample (the samples are quadrature points, as from gauss_legendre_ts()),
+	returns ( qts, qdts, first, second ), the t value and weight of each quadrature point
+	and the indices of the two samples whose average is the value of a sampled function there.
+	'''
+	ts = asarray( ts, dtype = float )
+	dts = asarray( dts, dtype = float )
+	
+	if len( dts ) == len( ts ):
+		indices = arange( len( ts ) )
+		return ts, dts, indices, indices
+	
+	assert len( dts ) == len( ts ) - 1
+	return .5*( ts[:-1] + ts[1:] ), dts, arange( len( ts ) - 1 ), arange( 1, len( ts ) )
+
+def sample_cubic_bezier_curves( Cset, ts ):
+	'''
+	Given an N-by-4-by-k numpy.array 'Cset' of the control points of N bezier curves
+	and a length-S sequence of t values 'ts',
+	returns an N-by-S-by-k numpy.array of the points of every curve at every t.
+	'''
+	Cset = asarray( Cset, dtype = float )
+	assert len( Cset.shape ) == 3 and Cset.shape[1] == 4
+	
+	return einsum( 'sj,njk->nsk', cubic_bezier_basis( ts ), Cset )
+
+def cubic_bezier_num_samples( Cset, tolerance, min_samples = 8, max_samples = 1000 ):
+	'''
+	Given an N-by-4-by-k numpy.array 'Cset' of the control points of N bezier curves
+	and a distance 'tolerance',
+	returns a length-N numpy.array of the number of evenly spaced samples each curve needs
+	so that the polyline through them is within 'tolerance' of the curve,
+	clipped to [ 'min_samples', 'max_samples' ].
+	
+	The polyline through n+1 samples is within max |P''(t)| / (8 n^2) of the curve,
+	and |P''(t)| is at most 6 times the larger of |P0 - 2 P1 + P2| and |P1 - 2 P2 + P3|,
+	so long, flat curves and short, curvy ones get few samples.
+	'''
+	Cset = asarray( Cset, dtype = float )
+	assert len( Cset.shape ) == 3 and Cset.shape[1] == 4
+	assert tolerance > 0
+	
+	second_differences = Cset[:,:-2] - 2*Cset[:,1:-1] + Cset[:,2:]
+	max_second_derivative = 6*sqrt( ( second_differences**2 ).sum( -1 ).max( -1 ) )
+	num_intervals = ceil( sqrt( max_second_derivative / ( 8.*tolerance ) ) ).astype( int )
+	
+	return ( num_intervals + 1 ).clip( min_samples, max_samples )
+
+def sample_cubic_bezier_curve_chain( Cset, num_samples = 100, tolerance = None, gauss_points = None ):
 	'''
 	Given a set of bezier curve chain control points 
 	and a positive integer representing the number of samples per curve in the chain,
 	returns a list of pairs ( samples, ts ) as would be returned by sample_cubic_bezier_curve().
 	
+	If 'num_samples' is not None, every curve has the same number of samples, so they are
+	all evaluated at once and returned as numpy.arrays with dimensions
+	#curves x num_samples x k, #curves x num_samples and #curves x num_samples-1.
+	
+	If 'tolerance' is not None, it is used instead of 'num_samples', and each curve gets as many
+	samples as cubic_bezier_num_samples() says it needs to be within 'tolerance' of its polyline.
+	The curves with the same number of samples are evaluated together.
+	
+	If 'gauss_points' is not None, it is used instead of both, and every curve is sampled at
+	the ts returned by gauss_legendre_ts( gauss_points ), whose dts have one weight per sample.
+	
 	if curves are open, add samples of the straight line that connect the begin and the end.
 	'''
+	
+	if gauss_points is not None:
+		Cset = asarray( Cset, dtype = float )
+		ts, dts = gauss_legendre_ts( gauss_points )
+		all_pts = sample_cubic_bezier_curves( Cset, ts )
+		all_ts = repeat( ts[newaxis,:], len( Cset ), axis = 0 )
+		all_dts = repeat( dts[newaxis,:], len( Cset ), axis = 0 )
+		return all_pts, all_ts, all_dts
+	
+	if tolerance is not None:
+		Cset = asarray( Cset, dtype = float )
+		counts = cubic_bezier_num_samples( Cset, tolerance )
+		all_pts = [ None ] * len( Cset )
+		all_ts = [ None ] * len( Cset )
+		all_dts = [ None ] * len( Cset )
+		for count in unique( counts ):
+			which = where( counts == count )[0]
+			ts = linspace( 0, 1, count )
+			dts = ones( count-1 ) * (1./(count-1) )
+			for curve, pts in zip( which, sample_cubic_bezier_curves( Cset[ which ], ts ) ):
+				all_pts[ curve ] = pts
+				all_ts[ curve ] = ts
+				all_dts[ curve ] = dts
+		return all_pts, all_ts, all_dts
+	
+	if num_samples is not None:
+		Cset = asarray( Cset, dtype = float )
+		ts = linspace( 0, 1, num_samples )
+		all_pts = sample_cubic_bezier_curves( Cset, ts )
+		all_ts = repeat( ts[newaxis,:], len( Cset ), axis = 0 )
+		all_dts = ones( ( len( Cset ), num_samples-1 ) ) * (1./(num_samples-1) )
+		return all_pts, all_ts, all_dts
+	
 	all_pts = []
 	all_ts = []
 	all_dts = []
@@ -29,6 +160,26 @@ def sample_cubic_bezier_curve_chain( Cset, num_samples = 100 ):
 
 	return all_pts, all_ts, all_dts
 
+def sample_arc_length_dts( Cset, all_pts, all_ts, all_dts ):
+	'''
+	Given the control points 'Cset' of a chain of bezier curves and
+	the 'all_pts', 'all_ts', and 'all_dts' returned by sample_cubic_bezier_curve_chain() for it,
+	returns, for each curve, the arc length each of its dts stands for, which sum to the curve's length.
+	
+	With the midpoint rule, these are the lengths of the segments between consecutive samples.
+	With Gauss-Legendre quadrature, they are each dt times the speed of the curve at its sample.
+	'''
+	
+	all_dss = []
+	for P, pts, ts, dts in zip( Cset, all_pts, all_ts, all_dts ):
+		if len( dts ) == len( ts ):
+			velocities = dot( cubic_bezier_derivative_basis( ts ), asarray( P, dtype = float ) )
+			all_dss.append( asarray( dts ) * sqrt( ( velocities**2 ).sum( axis = 1 ) ) )
+		else:
+			all_dss.append( sqrt( ( ( pts[ 1: ] - pts[ :-1 ] )**2 ).sum( axis = 1 ) ) )
+	
+	return all_dss
+
 def sample_cubic_bezier_curve( P, num_samples = 100 ):
 	'''
 	a 4-by-k numpy.array P containing the positions of the control points as the rows,
@@ -38,21 +189,12 @@ def sample_cubic_bezier_curve( P, num_samples = 100 ):
 		num_samples = max(int(length_of_cubic_bezier_curve(P) / 1), 2)
 	
 	P = asarray( P )
-	result = []
-	tbar = ones( (4,1) )
 	ts = linspace( 0, 1, num_samples )
-	for t in ts:
-		
-		tbar[0] = t**3
-		tbar[1] = t**2
-		tbar[2] = t
-		
-		point = dot( P.T, dot( M.T, tbar ) )
-		result.append( asarray(point).squeeze().tolist() )
+	result = sample_cubic_bezier_curves( P[newaxis], ts )[0]
 	
 	dts = ones( num_samples-1 ) * (1./(num_samples-1) )
 		
-	return asarray( result ), asarray( ts ), asarray( dts )
+	return result, ts, dts
 	
 	
 def sample_straight_line( begin, end, num_samples = 100 ):
@@ -81,18 +223,8 @@ def length_of_cubic_bezier_curve( P, num_samples = 100 ):
 	P = asarray( P )
 	assert P.shape[0] == 4
 	
-	samples = []
-	tbar = ones( 4 )
-	for t in linspace( 0, 1, num_samples ):
-		tbar[0] = t**3
-		tbar[1] = t**2
-		tbar[2] = t
-		tbar = tbar.reshape( (4,1) )
-		point = dot( P.T, dot( M.T, tbar ) )
-		samples.append( asarray(point).reshape(-1) )
-	
-	samples = asarray(samples)	
-	lengths = [mag(samples[i]-samples[i+1]) for i in range(len(samples)-1)] 
+	samples = sample_cubic_bezier_curves( P[newaxis], linspace( 0, 1, num_samples ) )[0]
+	lengths = sqrt( ( ( samples[1:] - samples[:-1] )**2 ).sum( axis = 1 ) )
 	
 	return sum( lengths )
 	
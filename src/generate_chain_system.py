@@ -3,6 +3,12 @@ from weights_computer import *
 
 import systems_and_solvers
 
+## Bundle.transformed_controls() recomputes its sum from scratch after this many incremental updates.
+kMaxIncrementalUpdates = 1000
+
+## The exact integral of dot( Mtbar, Mtbar.T ) dt over [0,1], M.T * A * M, where A is the integral of dot( tbar, tbar.T ).
+MAM_closed_form = asarray( [[ 20., 10., 4., 1. ], [ 10., 12., 9., 4. ], [ 4., 9., 12., 10. ], [ 1., 4., 10., 20. ]] ) / 140.
+
 class Bundle( object ):
 	def __init__( self, W_matrices, control_points, constraints, length, ts, dts,  mags = None, dirs = None ):
 		self.W_matrices = W_matrices
@@ -22,6 +28,65 @@ class Bundle( object ):
  			self.directions = [ dir_allow_zero((controls[1] - controls[0])[:2]), dir_allow_zero((controls[2] - controls[3])[:2]) ]
 		else:
 			self.directions = dirs
+		
+		## Caches for transformed_controls().
+		self.PMWs = None
+		self.transformed = None
+		self.transformed_for = None
+		self.incremental_updates = 0
+		
+		## Caches for arc_length_MAM() and the solvers' arc length systems built from it.
+		self.MAM_ds = None
+		self.arc_length_systems = None
+	
+	def arc_length_MAM( self ):
+		'''
+		Returns the integral of dot( Mtbar, Mtbar.T ) ds over this bundle's samples,
+		where its dts are the arc length ds of each sample.
+		It only depends on the samples, so it is computed once.
+		'''
+		if self.MAM_ds is None:
+			qts, qdss = quadrature_points( self.ts, self.dts )[:2]
+			basis = cubic_bezier_basis( qts )
+			self.MAM_ds = dot( basis.T * qdss, basis )
+		
+		return self.MAM_ds
+	
+	def transformed_controls( self, transforms ):
+		'''
+		Given the handle transforms T_i, returns the 3-by-4 matrix
+			sum_i T_i * P.T * M * W_i
+		for this bundle's control points P and W_matrices W_i.
+		
+		The products P.T * M * W_i don't depend on the transforms, so they are computed once.
+		The last result is kept along with the transforms it was computed for,
+		so that the next call only adds the terms of the handles whose transforms changed.
+		'''
+		Ts = asarray( transforms, dtype = float ).reshape( -1, 3, 3 )
+		
+		if self.PMWs is None:
+			PM = dot( asarray( self.control_points ).T, asarray( M ) )
+			self.PMWs = einsum( 'ab,hbc->hac', PM, asarray( self.W_matrices ) )
+		
+		if self.transformed_for is None or self.transformed_for.shape != Ts.shape:
+			changed = None
+		else:
+			changed = ( Ts != self.transformed_for ).any( axis = 2 ).any( axis = 1 )
+			## Recompute from scratch when it's as cheap, and every so often so that
+			## round-off from the incremental updates can't accumulate.
+			if 2*changed.sum() > len( Ts ) or self.incremental_updates >= kMaxIncrementalUpdates:
+				changed = None
+		
+		if changed is None:
+			self.transformed = einsum( 'hab,hbc->ac', Ts, self.PMWs )
+			self.transformed_for = Ts.copy()
+			self.incremental_updates = 0
+		elif changed.any():
+			self.transformed += einsum( 'hab,hbc->ac', Ts[ changed ] - self.transformed_for[ changed ], self.PMWs[ changed ] )
+			self.transformed_for[ changed ] = Ts[ changed ]
+			self.incremental_updates += 1
+		
+		return self.transformed.copy()
 				
 
 def compute_angle( bundle0, bundle1 ):
@@ -101,6 +166,8 @@ class BezierConstraintSolver( object ):
 		self.lambdas_per_joint = [ self.constraint_number_per_joint( constraint ) for constraint in constraints]
 
 		self.MAM = self.get_default_MAM()
+		## The MAM of each number of evenly spaced samples a bundle has, for get_MAM().
+		self.MAMs = { 100: self.MAM }
 		self.coefficient_matrices = self.get_default_left_matrices_for_even_iterations()
 		
 		### 2
@@ -121,10 +188,16 @@ class BezierConstraintSolver( object ):
 		self.system	 = self.zeros_system_build_t( ( self.system_size, self.system_size ) )
 		self.system_symbolic_factored = None
 		self.system_factored = None
+		## The structural fingerprint of the system when it was last symbolically factored.
+		self.system_fingerprint = None
+		self.symbolic_factorizations = 0
+		self.symbolic_factorizations_avoided = 0
 		self.rhs = zeros( self.system_size )
 		self.transforms = transforms
 		self.is_closed = is_closed
 		self.kArcLength = kArcLength
+		## What systems_for_curves() keeps between calls, for subclasses that assemble them all at once.
+		self.curve_system_parts = None
 		
 		self._update_bundles( )
 
@@ -139,25 +212,21 @@ class BezierConstraintSolver( object ):
 		system_size = self.system_size
 		system = self.system
 		angles = self.angles
-		kArcLength = self.kArcLength
 		rhs = self.rhs
 		transforms = self.transforms
 		is_closed = self.is_closed
 
 		### 3
+		if not lagrange_only:
+			small_systems = self.systems_for_curves()
+		
 		dof_offset = 0
 		for i in range(len( bundles )):
 			bundle = bundles[i]
 			dofs = sum(dofs_per_bundle[i])
 			
 			if not lagrange_only:
-# 				small_system = self.system_for_curve_with_arc_length( bundle )
-				
-				if kArcLength:
-					small_system = self.system_for_curve_with_arc_length( bundle )
-				else:
-					small_system = self.system_for_curve( bundle )
-				
+				small_system = small_systems[i]
 				small_rhs = self.rhs_for_curve( bundle, transforms)
 				### 4
 				system[ dof_offset : dof_offset + dofs, dof_offset : dof_offset + dofs ] = small_system
@@ -179,6 +248,7 @@ class BezierConstraintSolver( object ):
 			
 			### 4
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs + dofs_next ] = small_lagrange_system
+			system[ dof_offset : dof_offset + dofs + dofs_next, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 			rhs[ constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_rhs
 	
 			dof_offset += dofs
@@ -195,6 +265,8 @@ class BezierConstraintSolver( object ):
 			### 4
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs  ] = small_lagrange_system[ :, :dofs ]
 			system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, : dofs_next ] = small_lagrange_system[ :, dofs: ]
+			system[ dof_offset : dof_offset + dofs, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system[ :, :dofs ].T
+			system[ : dofs_next, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system[ :, dofs: ].T
 			rhs[ constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_rhs
 			constraint_equation_offset += constraint_eqs
 			
@@ -206,18 +278,20 @@ class BezierConstraintSolver( object ):
 			if lambdas_per_joint[-1] == 2:
 				small_lagrange_system, small_lagrange_rhs = self.lagrange_equations_for_fixed_opening( bundles[-1], is_head = False )
 				system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs_tail  ] = small_lagrange_system
+				system[ dof_offset : dof_offset + dofs_tail, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 				rhs[ constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_rhs
 				constraint_equation_offset += constraint_eqs
 				
 			if lambdas_per_joint[0] == 2:
 				small_lagrange_system, small_lagrange_rhs = self.lagrange_equations_for_fixed_opening( bundles[0], is_head = True )							
 				system[ constraint_equation_offset : constraint_equation_offset + constraint_eqs, dof_offset : dof_offset + dofs_tail  ] = small_lagrange_system
+				system[ dof_offset : dof_offset + dofs_tail, constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_system.T
 				rhs[ constraint_equation_offset : constraint_equation_offset + constraint_eqs ] = small_lagrange_rhs
 				constraint_equation_offset += constraint_eqs
 				
 				
-		## Set the upper-right portion of the system matrix, too
-		system[ : total_dofs, total_dofs : ] = system.T[ : total_dofs, total_dofs : ]
+		## The upper-right portion of the system matrix is set along with each lagrange block above,
+		## rather than with system.T, so that sparse and block system types never touch the whole matrix.
 		
 		# self.system	 = self.to_system_solve_t( system )
 		## Reset system_factored, but leave 'self.system_symbolic_factorization' alone,
@@ -230,7 +304,42 @@ class BezierConstraintSolver( object ):
 		# self.system_factored = None
 		
 	
+	def systems_for_curves( self ):
+		'''
+		Returns the system_for_curve() of every bundle in self.bundles,
+		or its system_for_curve_with_arc_length() if self.kArcLength.
+		'''
+		if self.kArcLength:
+			return [ self.system_for_curve_with_arc_length( bundle ) for bundle in self.bundles ]
+		else:
+			return [ self.system_for_curve( bundle ) for bundle in self.bundles ]
+	
+	def factor_system( self ):
+		'''
+		Makes sure that self.system_factored can solve the current self.system.
+		The symbolic factorization is recomputed only if the structural fingerprint
+		of the system changed since it was last computed.
+		Returns True if a new numeric factorization was computed.
+		'''
+		if self.system_factored is not None: return False
+		
+		fingerprint = systems_and_solvers.structural_fingerprint( self.system )
+		system = self.to_system_solve_t( self.system )
+		if self.system_symbolic_factored is None or fingerprint != self.system_fingerprint:
+			#print 'symbolic factoring'
+			self.system_symbolic_factored = self.compute_symbolic_factorization( system )
+			self.system_fingerprint = fingerprint
+			self.symbolic_factorizations += 1
+		else:
+			self.symbolic_factorizations_avoided += 1
+		
+		#print 'numeric factoring'
+		self.system_factored = self.system_symbolic_factored( system )
+		return True
+	
 	def update_rhs_for_handles( self, transforms ):
+		## Convert the transforms once rather than once per curve.
+		transforms = asarray( transforms, dtype = float ).reshape( -1, 3, 3 )
 		dof_offset = 0
 		for i in range(len( self.bundles )):
 			bundle = self.bundles[i]
@@ -303,9 +412,26 @@ class BezierConstraintSolver( object ):
 
 		return MAM
 		
-	def get_default_left_matrices_for_even_iterations( self ):
+	def get_MAM( self, bundle ):
+		'''
+		Returns the MAM integrated over the same evenly spaced samples as 'bundle',
+		so that it matches the quadrature of the bundle's W_matrices.
+		If the bundle's samples are Gauss-Legendre points (its dts have one weight per sample),
+		the quadrature is exact, so this is MAM_closed_form.
+		'''
+		
+		if len( bundle.dts ) == len( bundle.ts ):
+			return MAM_closed_form
+		
+		num_samples = len( bundle.ts )
+		if num_samples not in self.MAMs:
+			self.MAMs[ num_samples ] = self.get_default_MAM( num_samples )
+		return self.MAMs[ num_samples ]
+	
+	def get_default_left_matrices_for_even_iterations( self, MAM = None ):
 	
-		MAM = self.MAM	
+		if MAM is None:
+			MAM = self.MAM	
 		if MAM is None:	
 			MAM = self.get_default_MAM()
 			
@@ -347,8 +473,8 @@ class BezierConstraintSolver( object ):
 		Left4[2,2] = MAM[1,1]
 		## right top
 		Left4[0,-3] = Left4[1,-2] = MAM[0,-2] + MAM[0,-1] + MAM[1,-2] + MAM[1,-1]
-		Left4[2,-3] = Left4[2,-2] = ( MAM[0,-2] + MAM[1,-2] ) 
-		Left4[0,-1] = Left4[1,-1] = ( MAM[1,-2] + MAM[1,-1] )
+		Left4[2,-3] = Left4[2,-2] = ( MAM[1,-2] + MAM[1,-1] )
+		Left4[0,-1] = Left4[1,-1] = ( MAM[0,-2] + MAM[1,-2] )
 		Left4[2,-1] = MAM[1,-2]
 		## left bottom
 		Left4[ 3:, :3 ] = Left4[ :3, 3: ].T
@@ -17,3 +17,28 @@ kNoOverlays = False
 kComputeComparisonCurves = False
 kEngineType = EngineType['YSApproach']
 kGatheringTiming = False
+## The number of threads YSEngine uses to prepare and solve paths concurrently.
+## 1 means prepare and solve them one after another.
+kPathPoolWorkers = 1
+## The number of triangulations and BBW weights kept in memory, most recently used first.
+kWeightsCacheSize = 8
+## If not None, a directory where triangulations and BBW weights are also saved as .npz files,
+## so that they are reused across runs.
+kWeightsCacheDirectory = None
+## The number of vertices to aim for when triangulating a drawing for BBW or harmonic weights.
+## The maximum triangle area is chosen from the drawing's bounding box so that the mesh has at most about this many.
+## None uses the fixed area in triangle.triangle_options.
+kTriangleVertexBudget = 5000
+## The number of threads solving for BBW weights, one handle at a time.
+## None means one per CPU; 1 solves for all handles with a single call.
+kBBWThreads = None
+## If not None, each curve is sampled with as many evenly spaced samples as it needs
+## for the polyline through them to be within this distance of the curve, in drawing units (clipped to [8, 1000] samples).
+## None samples every curve 100 times.
+## Off by default: few samples on flat curves are too coarse for the W_i weight integrals,
+## and moved the solved control points of the test drawings by up to hundreds of units.
+kSampleTolerance = None
+## If not None, each curve is sampled at this many Gauss-Legendre points (plus its endpoints)
+## and its integrals are computed with Gauss-Legendre quadrature instead of the midpoint rule;
+## kSampleTolerance is then ignored. Integrals of the cubic basis are exact for 4 or more points.
+kGaussLegendrePoints = None
@@ -26,8 +26,7 @@ def distancesSqr_and_t_to_edges( pts, edges ):
     ##   dot( p-a, d ) > 1 => dot( p-b, p-b )
     ##   else              => dot( dot( p-a, d ) * (b-a) - p, same )
     p_a = pts[newaxis,...] - edges[...,:,0,:,newaxis]
-    p_b = pts[newaxis,...] - edges[...,:,1,:,newaxis]
-    ## p_a and p_b have dimensions ... x #edges x N coordinates (x,y,...) x #pts
+    ## p_a has dimensions ... x #edges x N coordinates (x,y,...) x #pts
     b_a = edges[...,:,1,:] - edges[...,:,0,:]
     ## b_a has dimensions ... x #edges x N coordinates (x,y,...)
     d = b_a / ( b_a**2 ).sum( -1 )[...,newaxis]
@@ -54,21 +53,109 @@ def distancesSqr_and_t_to_edges( pts, edges ):
     
     return distancesSqr, cond
 
-def min_distanceSqr_edge_t_to_edges( pts, edges ):
+## The most ( #edges x #pts ) pairs min_distanceSqr_edge_t_to_edges() computes at once.
+kMaxChunkElements = 1 << 20
+
+def min_distanceSqr_edge_t_to_edges( pts, edges, use_kdtree = False, max_chunk_elements = None ):
     '''
     Input parameter 'pts' has dimensions #pts x 2 (x,y).
-    Input parameter 'edges' has dimensions ... x #edges x 2 endpoints x 2 coordinates (x,y).
+    Input parameter 'edges' has dimensions #edges x 2 endpoints x 2 coordinates (x,y).
     Returns the tuple three things, each of which has length #pts and stores:
         (
         squared distance to the closest edge on 'line_strip',
         index of edge in 'edges' which contains the closest point,
         t along the edge such that the closest point is (1-t)*edges[index][0] + t*(edges[index][1])
         ).
+    
+    The points are processed in chunks of at most 'max_chunk_elements' (default: kMaxChunkElements)
+    point-edge pairs, so memory use stays bounded no matter how many points there are.
+    If 'use_kdtree' is True, only the edges near each point are considered (see
+    min_distanceSqr_edge_t_to_edges_kdtree()), which is much faster for many edges.
     '''
     
-    distancesSqr, cond = distancesSqr_and_t_to_edges( pts, edges )
-    edge_index = distancesSqr.argmin( -2 )
-    return distancesSqr[ edge_index ], edge_index, cond[ edge_index ]
+    if use_kdtree:
+        return min_distanceSqr_edge_t_to_edges_kdtree( pts, edges )
+    
+    if max_chunk_elements is None: max_chunk_elements = kMaxChunkElements
+    
+    pts = asfarray( pts )
+    edges = asfarray( edges )
+    
+    distancesSqr = empty( len( pts ) )
+    edge_index = empty( len( pts ), dtype = int )
+    ts = empty( len( pts ) )
+    
+    chunk = max( 1, max_chunk_elements // max( 1, len( edges ) ) )
+    for start in xrange( 0, len( pts ), chunk ):
+        end = min( start + chunk, len( pts ) )
+        chunk_distancesSqr, chunk_cond = distancesSqr_and_t_to_edges( pts[ start:end ], edges )
+        chunk_edge_index = chunk_distancesSqr.argmin( -2 )
+        pt_index = arange( end - start )
+        distancesSqr[ start:end ] = chunk_distancesSqr[ chunk_edge_index, pt_index ]
+        edge_index[ start:end ] = chunk_edge_index
+        ts[ start:end ] = chunk_cond[ chunk_edge_index, pt_index ]
+    
+    return distancesSqr, edge_index, ts
+
+def min_distanceSqr_edge_t_to_edges_kdtree( pts, edges, k = 8 ):
+    '''
+    The same as min_distanceSqr_edge_t_to_edges(), but only computes the distance
+    from each point to the edges whose midpoints are nearest to it, using a scipy.spatial.cKDTree.
+    
+    The result is still exact: an edge is at least as far from a point as its midpoint minus half its length,
+    so once the farthest midpoint considered is farther than the closest edge found plus the longest half length,
+    no other edge can be closer. Points for which that isn't true yet are searched again with 4 times as many edges,
+    and once that is more than a quarter of the edges, compared against all of them.
+    '''
+    
+    from scipy.spatial import cKDTree
+    
+    pts = asfarray( pts )
+    edges = asfarray( edges )
+    
+    assert len( edges ) > 0
+    
+    midpoints = .5 * ( edges[:,0] + edges[:,1] )
+    max_half_length = .5 * sqrt( ( ( edges[:,1] - edges[:,0] )**2 ).sum( -1 ).max() )
+    tree = cKDTree( midpoints )
+    
+    distancesSqr = empty( len( pts ) )
+    edge_index = empty( len( pts ), dtype = int )
+    ts = empty( len( pts ) )
+    
+    remaining = arange( len( pts ) )
+    while len( remaining ) > 0:
+        k = min( k, len( edges ) )
+        mid_distances, candidates = tree.query( pts[ remaining ], k )
+        mid_distances = mid_distances.reshape( len( remaining ), k )
+        candidates = candidates.reshape( len( remaining ), k )
+        
+        ## The exact distance to each candidate edge, as in distancesSqr_and_t_to_edges().
+        a = edges[ candidates, 0 ]
+        b_a = edges[ candidates, 1 ] - a
+        p_a = pts[ remaining ][ :, newaxis, : ] - a
+        cond = ( ( p_a * b_a ).sum( -1 ) / ( b_a**2 ).sum( -1 ) ).clip( 0, 1 )
+        candidate_distancesSqr = ( ( p_a - cond[...,newaxis] * b_a )**2 ).sum( -1 )
+        
+        best = candidate_distancesSqr.argmin( -1 )
+        pt_index = arange( len( remaining ) )
+        distancesSqr[ remaining ] = candidate_distancesSqr[ pt_index, best ]
+        edge_index[ remaining ] = candidates[ pt_index, best ]
+        ts[ remaining ] = cond[ pt_index, best ]
+        
+        if k == len( edges ): break
+        
+        done = mid_distances[:,-1] > sqrt( distancesSqr[ remaining ] ) + max_half_length
+        remaining = remaining[ ~done ]
+        k *= 4
+        
+        ## Points that are about as far from many edges (such as the center of a circle)
+        ## are cheaper to compare against every edge.
+        if 4*k > len( edges ):
+            distancesSqr[ remaining ], edge_index[ remaining ], ts[ remaining ] = min_distanceSqr_edge_t_to_edges( pts[ remaining ], edges )
+            break
+    
+    return distancesSqr, edge_index, ts
 
 def test_timing():
     import timeit, time
@@ -118,6 +205,30 @@ edges = [ [ [ u( 0,1 ) for d in range(dim) ], [ u( 0,1 ) for d in range(dim) ] ]
     
     print 'distancesSqr_to_edges:',
     print timeit.Timer( 'distancesSqr_and_t_to_edges( pts, edges )', setupNd ).repeat(4,N)
+    
+    ## Many points against a long boundary: a closed, wavy polyline around the origin, with points inside and out.
+    npts = 100000
+    nedges = 10000
+    r = random.RandomState( 7 )
+    angles = linspace( 0, 2*pi, nedges + 1 )
+    radii = 1 + .2*sin( 7*angles )
+    loop = ( radii * array([ cos( angles ), sin( angles ) ]) ).T
+    edges = array([ loop[:-1], loop[1:] ]).transpose( 1, 0, 2 )
+    pts = r.uniform( -1.5, 1.5, ( npts, 2 ) )
+    
+    print
+    print 'num points:', npts
+    print 'num edges:', nedges
+    
+    duration = time.time()
+    kdtree_result = min_distanceSqr_edge_t_to_edges( pts, edges, use_kdtree = True )
+    print 'min_distanceSqr_edge_t_to_edges( use_kdtree = True ):', time.time() - duration
+    
+    duration = time.time()
+    chunked_result = min_distanceSqr_edge_t_to_edges( pts, edges )
+    print 'min_distanceSqr_edge_t_to_edges( use_kdtree = False ):', time.time() - duration
+    
+    print 'maximum difference in squared distance:', abs( kdtree_result[0] - chunked_result[0] ).max()
 
 def test1():
     pt = [ 0,0 ]
@@ -0,0 +1,140 @@
+from numpy import *
+
+class Mesh2dPointLocation( object ):
+    '''
+    A uniform grid over the bounding box of a 2d triangle mesh, each of whose cells
+    knows which triangles' bounding boxes overlap it.
+    Make one with prepare_mesh2d_point_location() and query it with points2d_in_mesh2d_barycentric().
+    '''
+    
+    def cell_of( self, points2d ):
+        '''
+        Returns the (x,y) indices of the grid cell containing each point in 'points2d',
+        clipped to the grid.
+        '''
+        cells = floor( ( asfarray( points2d ) - self.origin ) / self.cell_size ).astype( int )
+        return clip( cells, 0, self.shape - 1 )
+
+def prepare_mesh2d_point_location( vertices2d, faces, faces_per_cell = 2. ):
+    '''
+    Given a mesh in the form of a list of 2d vertices 'vertices2d' and
+    a list of triangles (triplets of indices into 'vertices2d') named 'faces',
+    and an optional average number of triangles per grid cell 'faces_per_cell',
+    returns a Mesh2dPointLocation for points2d_in_mesh2d_barycentric().
+    '''
+    
+    vertices2d = asfarray( vertices2d )[:,:2]
+    faces = asarray( faces, dtype = int ).reshape( -1, 3 )
+    
+    assert len( vertices2d ) > 0
+    
+    result = Mesh2dPointLocation()
+    result.vertices2d = vertices2d
+    result.faces = faces
+    
+    ## The corners of the triangles.
+    ## corners has dimensions #faces x 3 corners x 2 coordinates (x,y)
+    corners = vertices2d[ faces ]
+    
+    ## Choose square cells so that there are about 'faces_per_cell' triangles per cell.
+    result.origin = vertices2d.min( axis = 0 )
+    extent = vertices2d.max( axis = 0 ) - result.origin
+    cell_size = sqrt( max( extent[0]*extent[1], 1e-300 ) * faces_per_cell / max( len( faces ), 1 ) )
+    ## Don't make more cells along a side than there are triangles.
+    cell_size = max( cell_size, extent.max() / max( len( faces ), 1 ), 1e-300 )
+    result.cell_size = cell_size
+    result.shape = maximum( ceil( extent / cell_size ).astype( int ), 1 )
+    
+    ## The range of cells each triangle's bounding box overlaps.
+    lo = result.cell_of( corners.min( axis = 1 ) )
+    hi = result.cell_of( corners.max( axis = 1 ) )
+    span = hi - lo + 1
+    counts = span[:,0] * span[:,1]
+    
+    ## Pair every triangle with every cell in its range.
+    face_of_pair = repeat( arange( len( faces ) ), counts )
+    local = arange( counts.sum() ) - repeat( cumsum( counts ) - counts, counts )
+    x = lo[ face_of_pair, 0 ] + local % span[ face_of_pair, 0 ]
+    y = lo[ face_of_pair, 1 ] + local // span[ face_of_pair, 0 ]
+    cell_of_pair = y * result.shape[0] + x
+    
+    ## Sort the pairs by cell. The faces of cell c are
+    ## cell_faces[ cell_start[c] : cell_start[c+1] ].
+    order = argsort( cell_of_pair, kind = 'mergesort' )
+    result.cell_faces = face_of_pair[ order ]
+    result.cell_start = concatenate( ( [0], cumsum( bincount( cell_of_pair, minlength = result.shape[0]*result.shape[1] ) ) ) )
+    
+    return result
+
+def points2d_in_mesh2d_barycentric( points2d, mesh, epsilon = 1e-10 ):
+    '''
+    Given an N-by-2 sequence of 2d points 'points2d' and
+    a Mesh2dPointLocation 'mesh' returned by prepare_mesh2d_point_location(),
+    returns a tuple ( fis, barys ), where
+        fis is a length-N numpy.array of the index of the face in mesh.faces containing each point,
+            or -1 if the point is not inside the mesh, and
+        barys is an N-by-3 numpy.array of the barycentric coordinates (b0, b1, b2) inside that triangle.
+    A point is inside a triangle if none of its barycentric coordinates is less than -'epsilon'.
+    Like raytri.point2d_in_mesh2d_barycentric(), if a point is inside several triangles,
+    the one with the largest smallest barycentric coordinate is returned.
+    '''
+    
+    points2d = asfarray( points2d ).reshape( -1, 2 )
+    
+    fis = -ones( len( points2d ), dtype = int )
+    barys = zeros( ( len( points2d ), 3 ) )
+    
+    if len( points2d ) == 0 or len( mesh.faces ) == 0: return fis, barys
+    
+    ## Points outside the grid can't be inside the mesh.
+    upper = mesh.origin + mesh.shape * mesh.cell_size
+    in_grid = where( ( points2d >= mesh.origin ).all( axis = 1 ) & ( points2d <= upper ).all( axis = 1 ) )[0]
+    
+    ## Pair every point with every triangle in its cell.
+    cells = mesh.cell_of( points2d[ in_grid ] )
+    cells = cells[:,1] * mesh.shape[0] + cells[:,0]
+    starts = mesh.cell_start[ cells ]
+    counts = mesh.cell_start[ cells + 1 ] - starts
+    point_of_pair = repeat( in_grid, counts )
+    local = arange( counts.sum() ) - repeat( cumsum( counts ) - counts, counts )
+    face_of_pair = mesh.cell_faces[ repeat( starts, counts ) + local ]
+    
+    ## The barycentric coordinates of each point in each of its triangles.
+    corners = mesh.vertices2d[ mesh.faces[ face_of_pair ] ]
+    e1 = corners[:,1] - corners[:,0]
+    e2 = corners[:,2] - corners[:,0]
+    p = points2d[ point_of_pair ] - corners[:,0]
+    det = e1[:,0]*e2[:,1] - e1[:,1]*e2[:,0]
+    ## Skip degenerate triangles.
+    det[ det == 0 ] = nan
+    u = ( p[:,0]*e2[:,1] - p[:,1]*e2[:,0] ) / det
+    v = ( e1[:,0]*p[:,1] - e1[:,1]*p[:,0] ) / det
+    pair_barys = column_stack( ( 1. - u - v, u, v ) )
+    
+    ## Keep the pairs where the point is inside, and for each point
+    ## the one whose smallest barycentric coordinate is the largest.
+    score = pair_barys.min( axis = 1 )
+    inside = where( score >= -epsilon )[0]
+    order = inside[ lexsort( ( -score[ inside ], point_of_pair[ inside ] ) ) ]
+    first = order[ concatenate( ( [True], point_of_pair[ order[1:] ] != point_of_pair[ order[:-1] ] ) ) ] if len( order ) > 0 else order
+    
+    fis[ point_of_pair[ first ] ] = face_of_pair[ first ]
+    barys[ point_of_pair[ first ] ] = pair_barys[ first ]
+    
+    return fis, barys
+
+def test_one_triangle():
+    vertices = [ (0,0), (0,1), (1,0) ]
+    faces = [ (0,1,2) ]
+    
+    pts = vertices + [ ( .1,.1 ), ( -.1, -.1 ), ( .5, 0 ), ( 0, .5 ) ]
+    
+    mesh = prepare_mesh2d_point_location( vertices, faces )
+    fis, barys = points2d_in_mesh2d_barycentric( pts, mesh )
+    for pt, fi, bary in zip( pts, fis, barys ):
+        print 'point:', pt, 'face:', fi, 'bary:', bary
+
+def main():
+    test_one_triangle()
+
+if __name__ == '__main__': main()
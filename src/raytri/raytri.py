@@ -219,6 +219,124 @@ def _raytri_wrapper_ray_mesh_intersections( ray, mesh ):
 
 ray_mesh_intersections = _raytri_wrapper_ray_mesh_intersections
 
+class RaytriMesh2d( object ):
+    '''
+    A 2d triangle mesh whose vertices (with a 0 z coordinate) and faces have already been
+    converted to the contiguous arrays libraytri takes.
+    Make one with prepare_raytri_mesh2d() and query it with points2d_in_raytri_mesh2d_barycentric().
+    '''
+    pass
+
+def prepare_raytri_mesh2d( vertices2d, faces ):
+    '''
+    Given a mesh in the form of a list of 2d vertices 'vertices2d' and
+    a list of triangles (triplets of indices into 'vertices2d') named 'faces',
+    returns a RaytriMesh2d for points2d_in_raytri_mesh2d_barycentric().
+    '''
+    
+    vertices2d = asarray( vertices2d, dtype = ctypes.c_double )
+    assert len( vertices2d.shape ) == 2 and vertices2d.shape[1] == 2
+    
+    result = RaytriMesh2d()
+    result.vs = zeros( ( len( vertices2d ), 3 ), dtype = ctypes.c_double )
+    result.vs[:,:2] = vertices2d
+    result.faces = to_ctypes_array( faces, ctypes.c_int ).reshape( -1, 3 )
+    return result
+
+## Libraries built before libraytri's points2d_in_mesh2d_barycentric() was added don't have it,
+## so it is looked up the first time it is needed (see _raytri_wrapper_points2d_in_mesh2d_barycentric()).
+__raytri_wrapper_points2d_in_mesh2d_barycentric = None
+def _raytri_wrapper_points2d_in_mesh2d_barycentric():
+    '''
+    Returns libraytri's points2d_in_mesh2d_barycentric() with its argument types set,
+    or None if the library doesn't have it.
+    '''
+    
+    global __raytri_wrapper_points2d_in_mesh2d_barycentric
+    
+    if __raytri_wrapper_points2d_in_mesh2d_barycentric is None:
+        try:
+            function = libraytri.points2d_in_mesh2d_barycentric
+        except AttributeError:
+            return None
+        
+        function.argtypes = \
+            [
+                ctypes.c_int,
+                ctypes.POINTER( ctypes.c_double ),
+                ctypes.c_int,
+                ctypes.POINTER( ctypes.c_double ),
+                ctypes.c_int,
+                ctypes.POINTER( ctypes.c_int ),
+                ctypes.POINTER( ctypes.c_int ),
+                ctypes.POINTER( ctypes.c_double )
+            ]
+        function.restype = ctypes.c_int
+        __raytri_wrapper_points2d_in_mesh2d_barycentric = function
+    
+    return __raytri_wrapper_points2d_in_mesh2d_barycentric
+
+def points2d_in_raytri_mesh2d_barycentric_by_ray( points2d, mesh ):
+    '''
+    The same as points2d_in_raytri_mesh2d_barycentric(), but with one call to
+    ray_mesh_intersections() per point, for libraries without libraytri's points2d_in_mesh2d_barycentric().
+    '''
+    
+    points2d = asarray( points2d, dtype = ctypes.c_double ).reshape( -1, 2 )
+    
+    fis = -ones( len( points2d ), dtype = ctypes.c_int )
+    barys = zeros( ( len( points2d ), 3 ), dtype = ctypes.c_double )
+    
+    for i, ( x, y ) in enumerate( points2d ):
+        ## Make a ray above the mesh pointing down
+        intersections = ray_mesh_intersections( ( ( x, y, 1 ), ( 0, 0, -1 ) ), mesh )
+        if len( intersections ) == 0: continue
+        ## Otherwise, keep the intersection with the largest smallest barycentric coordinate,
+        ## so the "most" inside the triangle.
+        intersections = [ ( fi, ( 1.-u-v, u, v ) ) for ( t, fi, ( u,v ) ) in intersections ]
+        smallest = asarray([ bary for fi, bary in intersections ]).min( axis = 1 ).argmax()
+        fis[i], barys[i] = intersections[ smallest ]
+    
+    return fis, barys
+
+def points2d_in_raytri_mesh2d_barycentric( points2d, mesh ):
+    '''
+    Given an N-by-2 sequence of 2d points 'points2d' and
+    a RaytriMesh2d 'mesh' returned by prepare_raytri_mesh2d(),
+    returns a tuple ( fis, barys ), where
+        fis is a length-N numpy.array of the index of the face in mesh.faces containing each point,
+            or -1 if the point is not inside the mesh, and
+        barys is an N-by-3 numpy.array of the barycentric coordinates (b0, b1, b2) inside that triangle.
+    Each point is located the same way as by point2d_in_mesh2d_barycentric(), but with one call into libraytri's points2d_in_mesh2d_barycentric(),
+    or with points2d_in_raytri_mesh2d_barycentric_by_ray() if the library was built without it.
+    
+    NOTE: This tests every point against every face (skipping the faces whose bounding box doesn't contain it),
+          so it takes time proportional to #points x #faces. To locate many points in a large mesh,
+          use raytri.point_location's grid instead.
+    '''
+    
+    function = _raytri_wrapper_points2d_in_mesh2d_barycentric()
+    if function is None:
+        return points2d_in_raytri_mesh2d_barycentric_by_ray( points2d, mesh )
+    
+    points2d = to_ctypes_array( points2d, ctypes.c_double ).reshape( -1, 2 )
+    
+    fis = empty( len( points2d ), dtype = ctypes.c_int )
+    barys = empty( ( len( points2d ), 3 ), dtype = ctypes.c_double )
+    
+    function(
+        len( points2d ),
+        ctypes_array_ref( points2d, ctypes.c_double ),
+        len( mesh.vs ),
+        ctypes_array_ref( mesh.vs, ctypes.c_double ),
+        len( mesh.faces ),
+        ctypes_array_ref( mesh.faces, ctypes.c_int ),
+        ctypes_array_ref( fis, ctypes.c_int ),
+        ctypes_array_ref( barys, ctypes.c_double )
+        )
+    
+    return fis, barys
+
 def point2d_in_mesh2d_barycentric( point2d, vertices2d, faces ):
     '''
     Given a 2d point 'point2d' and mesh in the form of a list of
@@ -228,6 +346,12 @@ def point2d_in_mesh2d_barycentric( point2d, vertices2d, faces ):
         fi is the index of the face in mesh.faces, and
         (b0, b1, b2) represents the barycentric coordinates inside the triangle.
     If the point is not inside the mesh, returns None.
+    If the point is inside several triangles (on an edge), returns the one in which
+    the smallest barycentric coordinate is largest, so the "most" inside the triangle.
+    This should give a reasonable result with regards to negative epsilon issues.
+    
+    NOTE: To locate many points in the same mesh, use raytri.point_location's
+          prepare_mesh2d_point_location() and points2d_in_mesh2d_barycentric().
     
     tested (see test_one_triangle(), below)
     '''
@@ -235,28 +359,9 @@ def point2d_in_mesh2d_barycentric( point2d, vertices2d, faces ):
     assert len( point2d ) == 2
     assert len( vertices2d[0] ) == 2
     
-    ## Make a ray above the mesh pointing down
-    point = ( point2d[0], point2d[1], 1 )
-    dir = ( 0, 0, -1 )
-    
-    vertices = zeros( ( len( vertices2d ), 3 ) )
-    vertices[:,:2] = vertices2d
-    
-    class Object( object ): pass
-    
-    mesh = Object()
-    mesh.vs = vertices
-    mesh.faces = faces
-    
-    intersections = ray_mesh_intersections( ( point, dir ), mesh )
-    if len( intersections ) == 0: return None
-    ## Otherwise, return the intersection with the largest smallest barycentric coordinate,
-    ## so the "most" inside the triangle. This should give a reasonable result
-    ## with regards to negative epsilon issues.
-    # if len( intersections ) > 1: print 'more than 1 intersection. ts are:', [ t for t, fi, uv in intersections ]
-    intersections = [ ( fi, ( 1.-u-v, u, v ) ) for ( t, fi, ( u,v ) ) in intersections ]
-    smallest = asarray([ bary for fi, bary in intersections ]).min( axis = 1 ).argmax()
-    return intersections[ smallest ]
+    fis, barys = points2d_in_raytri_mesh2d_barycentric( [ point2d ], prepare_raytri_mesh2d( vertices2d, faces ) )
+    if fis[0] == -1: return None
+    return int( fis[0] ), tuple( barys[0] )
 
 def closest_distsqr_and_edge_index_and_t_on_edges_to_point( edges, pt ):
     '''
@@ -58,4 +58,94 @@ void ray_mesh_intersections_free( struct raymesh_intersection_t* intersections )
     delete [] intersections;
 }
 
+int points2d_in_mesh2d_barycentric(
+    int n_points, double* points2d,
+    int n_vertices, double* vertices, int n_faces, int* faces,
+    int* fis_out, double* barys_out
+    )
+{
+    assert( n_points >= 0 );
+    assert( points2d );
+    assert( n_vertices >= 0 );
+    assert( vertices );
+    assert( n_faces >= 0 );
+    assert( faces );
+    assert( fis_out );
+    assert( barys_out );
+    
+    // The xy bounding box of each face, so most faces can be skipped without intersecting them.
+    std::vector< double > bounds( 4*n_faces );
+    for( int i = 0; i < n_faces; ++i )
+    {
+        double* bound = &bounds[ 4*i ];
+        bound[0] = bound[2] = vertices[ 3 * faces[ 3*i + 0 ] + 0 ];
+        bound[1] = bound[3] = vertices[ 3 * faces[ 3*i + 0 ] + 1 ];
+        for( int c = 1; c < 3; ++c )
+        {
+            const double* vertex = vertices + 3 * faces[ 3*i + c ];
+            bound[0] = std::min( bound[0], vertex[0] );
+            bound[1] = std::min( bound[1], vertex[1] );
+            bound[2] = std::max( bound[2], vertex[0] );
+            bound[3] = std::max( bound[3], vertex[1] );
+        }
+    }
+    
+    int num_found = 0;
+    
+    // A ray above the mesh pointing down.
+    double ray_origin[3] = { 0., 0., 1. };
+    double ray_direction[3] = { 0., 0., -1. };
+    
+    double t, u, v;
+    for( int p = 0; p < n_points; ++p )
+    {
+        ray_origin[0] = points2d[ 2*p + 0 ];
+        ray_origin[1] = points2d[ 2*p + 1 ];
+        
+        fis_out[p] = -1;
+        double best = 0.;
+        for( int i = 0; i < n_faces; ++i )
+        {
+            const double* bound = &bounds[ 4*i ];
+            if(
+                ray_origin[0] < bound[0] || ray_origin[1] < bound[1] ||
+                ray_origin[0] > bound[2] || ray_origin[1] > bound[3]
+                )
+                continue;
+            
+            if( !intersect_triangle1(
+                ray_origin, ray_direction,
+                vertices + 3 * faces[ 3*i + 0 ],
+                vertices + 3 * faces[ 3*i + 1 ],
+                vertices + 3 * faces[ 3*i + 2 ],
+                &t, &u, &v
+                ) )
+                continue;
+            
+            // Keep the intersection with the largest smallest barycentric coordinate,
+            // so the "most" inside the triangle.
+            const double smallest = std::min( 1.-u-v, std::min( u, v ) );
+            if( fis_out[p] == -1 || smallest > best )
+            {
+                best = smallest;
+                fis_out[p] = i;
+                barys_out[ 3*p + 0 ] = 1.-u-v;
+                barys_out[ 3*p + 1 ] = u;
+                barys_out[ 3*p + 2 ] = v;
+            }
+        }
+        
+        if( fis_out[p] == -1 )
+        {
+            barys_out[ 3*p + 0 ] = barys_out[ 3*p + 1 ] = barys_out[ 3*p + 2 ] = 0.;
+        }
+        else
+        {
+            ++num_found;
+        }
+    }
+    
+    return num_found;
+}
+
 }
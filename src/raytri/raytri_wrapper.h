@@ -23,4 +23,18 @@ struct raymesh_intersection_t* ray_mesh_intersections(
 // Call this to free the memory returned by ray_mesh_intersections()
 void ray_mesh_intersections_free( struct raymesh_intersection_t* intersections );
 
+// For each of the 'n_points' 2d points in the flattened list 'points2d' (succession of xy coordinates),
+// finds the face of the mesh (given as in ray_mesh_intersections(), with the z coordinate of
+// every vertex 0) containing the point, as in a ray_mesh_intersections() call with a ray from
+// above the point pointing down.
+// The index of the face is stored in 'fis_out' (length 'n_points'), or -1 if no face contains the point,
+// and the barycentric coordinates inside the face in 'barys_out' (length 3*'n_points').
+// If several faces contain the point, the one with the largest smallest barycentric coordinate is chosen.
+// Returns the number of points inside the mesh.
+int points2d_in_mesh2d_barycentric(
+    int n_points, double* points2d,
+    int n_vertices, double* vertices, int n_faces, int* faces,
+    int* fis_out, double* barys_out
+    );
+
 #endif /* __raytri_wrapper_h__ */
@@ -117,7 +117,7 @@ class Engine:
 		deformed_curves_per_path = []
 		for k, solution in enumerate(solutions):
 
-			tps = dot( array([all_ts[k]**3, all_ts[k]**2, all_ts[k], ones(all_ts[k].shape)]).T, asarray( dot( M, solution ) ) )
+			tps = dot( cubic_bezier_basis( all_ts[k] ), asarray( solution ) )
 			deformed_curves_per_path.append(tps)
 			
 		return deformed_curves_per_path	
@@ -141,23 +141,22 @@ class Engine:
 		weight_function = self.weight_function
 		
 		num_samples = 100
-		all_pts, all_ts, all_dts = [], [], []
+		all_pts, all_ts, all_dts, all_lengths = [], [], [], []
 		for control_pos in all_controls:
-			pts, ts, dts = sample_cubic_bezier_curve_chain( control_pos, num_samples )
+			pts, ts, dts = sample_cubic_bezier_curve_chain( control_pos, num_samples, parameters.kSampleTolerance, parameters.kGaussLegendrePoints )
 			all_pts.append( pts )
 			all_ts.append( ts )
 			all_dts.append( dts )
+			all_lengths.append( asarray( [ curve_dss.sum() for curve_dss in sample_arc_length_dts( control_pos, pts, ts, dts ) ] ) )
 			
 		all_vertices, all_weights, all_indices = compute_all_weights( all_pts, handle_positions, boundary_index, weight_function )
 		
-		all_pts, all_ts, all_dts = asarray( all_pts ), asarray( all_ts ), asarray( all_dts )
-		
 		energy, target_paths, distances = [], [], []
 		for i in range( self.num_of_paths ):
 
 			path_indices = all_indices[i]		
 			path_pts, path_ts, path_dts = all_pts[i], all_ts[i], all_dts[i]
-			path_lengths = asarray( [ map( mag, ( curve_pts[1:] - curve_pts[:-1] ) ) for curve_pts in path_pts ]).sum( axis=1 )
+			path_lengths = all_lengths[i]
 			
 			target_path = self.compute_target_path( path_indices, all_vertices, transforms, all_weights )
 			target_paths.append( target_path )
@@ -285,86 +284,70 @@ class JacobianEngine(Engine):
 	(n.b. not the inverse transpose of it; these are tangents, not normals)
 	return new control points 
 	'''
+	def init_engine( self, paths_info, boundary_index ):
+		Engine.init_engine( self, paths_info, boundary_index )
+		## The shepard weights depend on the control points.
+		self.endpoint_gradients = None
+	
+	def copy_engine( self, engine ):
+		Engine.copy_engine( self, engine )
+		self.endpoint_gradients = None
+	
+	def set_handle_positions( self, new_handle_positions, new_transforms = None ):
+		Engine.set_handle_positions( self, new_handle_positions, new_transforms )
+		## The shepard weights depend on the handles.
+		self.endpoint_gradients = None
+	
 	def prepare_to_solve( self ):
-		pass
-
-	def solve_transform_change( self ):
-		all_controls, handle_positions, transforms = self.all_controls, self.handle_positions, self.transforms
-
+		'''
+		compute the shepard weights of all control points and their derivatives at the curve endpoints,
+		which only depend on the handles and the rest geometry, so solve_transform_change() can reuse them every frame.
+		'''
+		all_controls, handle_positions = self.all_controls, self.handle_positions
+		
 		all_vertices, all_weights, all_indices = compute_all_weights_shepard( all_controls, handle_positions )
 		
-		def shepard_jacobian( handle_positions, transforms, T_p, p ):
-			'''
-			return a 2-by-2 jacobian matrix
-			'''
-			jac = zeros( (2,2) )
-			 
-			def derivative_ws( hs ): 
-				'''
-				compute an array of derivative of w_i with respect to x or y, k = 0 means x, k = 1 means y
-				'''
-				hs = asarray( hs )
-				assert len( hs.shape ) == 2			
-			 	assert hs.shape[1] == p.shape[0]
-			 	
-			 	## Compute the distance squared from each handle position.
-				diffs = p - hs
-				diffs = diffs**2
-				diffs = diffs.sum( axis = 1 )
-				
-				eps = 1e-7
-				## where() gives us the indices where the condition is true.
-				wh = where( abs( diffs ) < eps )
-				assert len( wh ) == 1
-				if len( wh[0] ) > 0: return zeros( len( hs ) )
-
-				us = asarray( 1. / diffs )
-				dus = asarray ([-2.*sep_diff/square_sum**2 for sep_diff, square_sum in zip( (p-hs), diffs )])
-				
-				derivatives = [ dus[i] / us.sum() - us[i]*dus.sum(axis=0) / us.sum()**2 for i in range( len(hs) ) ]
-				
-				return derivatives
-				
-			derivatives = asarray( derivative_ws( handle_positions ) )
-			transforms = asarray( transforms )
-
-			T_x = asarray([d*transform for d, transform in zip(derivatives[:, 0], transforms)]).sum(axis=0).squeeze()
-			T_y = asarray([d*transform for d, transform in zip(derivatives[:, 1], transforms)]).sum(axis=0).squeeze()
-			
-			jac[0,0] = T_p[0,0] + T_x[0,0]*p[0] + T_x[0,1]*p[1] + T_x[0,2]
- 			jac[0,1] = T_p[0,1] + T_y[0,0]*p[0] + T_y[0,1]*p[1] + T_y[0,2]
-			jac[1,0] = T_p[1,0] + T_x[1,0]*p[0] + T_x[1,1]*p[1] + T_x[1,2]
- 			jac[1,1] = T_p[1,1] + T_y[1,0]*p[0] + T_y[1,1]*p[1] + T_y[1,2]
- 			
- 			return jac
- 			
- 			
-		result = []
-		for path_indices in all_indices:
-			path_controls = []
-			for indices in path_indices:
-				assert len( indices ) == 4
-
-				As = dot( asarray(transforms).T, all_weights[ indices ].T ).T
-				Bs = append( all_vertices[ indices ], ones( ( len( indices ), 1 ) ), axis = 1 )
-				
-				tps = asarray([ dot( A, B ) for A, B in zip( As, Bs ) ])
-				## replace the two interior control points' position to endpoint + Jacobian * derivative vector
-				vectors = asarray( [all_vertices[indices[1]] - all_vertices[indices[0]],
-									all_vertices[indices[2]] - all_vertices[indices[3]] ] ) 
-				
-				tps[1,:2] = tps[0,:2] + dot( shepard_jacobian( handle_positions, transforms, As[0], all_vertices[indices[0]] ), vectors[0] )
-				tps[2,:2] = tps[3,:2] + dot( shepard_jacobian( handle_positions, transforms, As[3], all_vertices[indices[3]] ), vectors[1] )
-
-				path_controls.append(tps)
-			result.append( path_controls )
+		## The four vertex indices of every curve in every path, and how many curves each path has.
+		curve_indices = concatenate( [ asarray( path_indices, dtype = int ).reshape( -1, 4 ) for path_indices in all_indices ] )
+		path_lengths = [ len( path_indices ) for path_indices in all_indices ]
 		
-		result = [ asarray(path)[:,:,:2] for path in result ]
+		## The derivatives of the weights at the first and last control point of each curve.
+		## endpoint_gradients has dimensions #curves x 2 endpoints x #handles x 2 (x,y)
+		endpoint_gradients = shepard_gradients( all_vertices[ curve_indices[:, [0,3]].ravel() ], asarray( handle_positions ) )
+		endpoint_gradients = endpoint_gradients.reshape( len( curve_indices ), 2, len( handle_positions ), 2 )
+		
+		self.all_vertices, self.all_weights, self.curve_indices, self.path_lengths = all_vertices, all_weights, curve_indices, path_lengths
+		self.endpoint_gradients = endpoint_gradients
+	
+	def solve_transform_change( self ):
+		## The weights are cleared when the handles or control points change.
+		if self.endpoint_gradients is None:
+			self.prepare_to_solve()
+		
+		transforms = asarray( self.transforms )
+		all_vertices, all_weights, curve_indices = self.all_vertices, self.all_weights, self.curve_indices
+		
+		## The blended transform of each curve's control points.
+		## As has dimensions #curves x 4 control points x 3 x 3
+		As = einsum( 'cih,hab->ciab', all_weights[ curve_indices ], transforms )
+		Bs = append( all_vertices[ curve_indices ], ones( curve_indices.shape + (1,) ), axis = 2 )
+		tps = einsum( 'ciab,cib->cia', As, Bs )
+		
+		## The jacobian of the deformation at each curve endpoint, where column k is the derivative with respect to x or y:
+		## jac[a,k] = T_p[a,k] + sum_b dT/dk[a,b] * (x,y,1)[b]
+		## dTs has dimensions #curves x 2 endpoints x 2 (x,y) x 3 x 3
+		dTs = einsum( 'cehk,hab->cekab', self.endpoint_gradients, transforms )
+		jacs = As[ :, [0,3], :2, :2 ] + einsum( 'cekab,ceb->ceak', dTs[ :, :, :, :2, : ], Bs[ :, [0,3] ] )
+		
+		## replace the two interior control points' position to endpoint + Jacobian * derivative vector
+		vectors = all_vertices[ curve_indices[:, [1,2]] ] - all_vertices[ curve_indices[:, [0,3]] ]
+		tps[:,[1,2],:2] = tps[:,[0,3],:2] + einsum( 'ceak,cek->cea', jacs, vectors )
+		
+		result = split( tps[:,:,:2], cumsum( self.path_lengths )[:-1] )
 		
 		self.solutions = result	
 		return result
 		
-
 	
 class YSEngine(Engine):
 	'''
@@ -381,6 +364,11 @@ class YSEngine(Engine):
 		self.weight_function = 'bbw'
 		self.is_arc_enabled = parameters.kArcLengthDefault
 		self.perform_multiple_iterations = True
+		self.use_linear_basis = True
+		self.linear_basis = None
+		self.path_pool = None
+		## The number of threads in self.path_pool.
+		self.path_pool_workers = 0
 		self.precomputed_parameter_table = []
 
 	def copy_engine( self, engine ):
@@ -388,6 +376,11 @@ class YSEngine(Engine):
 
 		self.is_arc_enabled = parameters.kArcLengthDefault
 		self.perform_multiple_iterations = True
+		self.use_linear_basis = True
+		self.linear_basis = None
+		self.path_pool = None
+		## The number of threads in self.path_pool.
+		self.path_pool_workers = 0
 		self.precomputed_parameter_table = []
 		 		
 	def constraint_change( self, path_index, joint_index, constraint ):
@@ -412,7 +405,9 @@ class YSEngine(Engine):
 		
 		weight_function = self.weight_function
 		is_arc_enabled = self.is_arc_enabled
-		layer1 = precompute_all_when_configuration_change( self.boundary_index, all_controls, handles, weight_function, is_arc_enabled )
+		## Only recompute what depends on whatever changed since the last layer.
+		previous = self.precomputed_parameter_table[0] if len( self.precomputed_parameter_table ) > 0 else None
+		layer1 = precompute_all_when_configuration_change( self.boundary_index, all_controls, handles, weight_function, is_arc_enabled, previous )
 		self.precomputed_parameter_table = []
 		self.precomputed_parameter_table.append( layer1 )
 		
@@ -437,28 +432,100 @@ class YSEngine(Engine):
 		is_arc_enabled = self.is_arc_enabled
 		
 		tic( 'Generating system matrices...' )
-		self.fast_update_functions = []
+		arguments = []
 		for i, controls, constraints in zip( range( len( all_controls ) ), all_controls, all_constraints ):
 			W_matrices = precomputed_parameters.W_matrices[i]
 			ts = precomputed_parameters.all_ts[i]
 			dts = precomputed_parameters.all_dts[i]
 			lengths = precomputed_parameters.all_lengths[i]
 			
-			fast_update = prepare_approximate_beziers( controls, constraints, handles, transforms, lengths, W_matrices, ts, dts, is_arc_enabled )
-			self.fast_update_functions.append( fast_update )
+			arguments.append( ( controls, constraints, handles, transforms, lengths, W_matrices, ts, dts, is_arc_enabled ) )
+		
+		prepared = self.map_paths( prepare_approximate_beziers, arguments )
+		self.fast_update_functions = [ fast_update for fast_update, linear_basis, metrics in prepared ]
+		self.linear_basis_functions = [ linear_basis for fast_update, linear_basis, metrics in prepared ]
+		self.iteration_metrics = [ metrics for fast_update, linear_basis, metrics in prepared ]
+		self.linear_basis = None
 		toc()
+	
+	def map_paths( self, function, arguments ):
+		'''
+		Returns [ function( *args ) for args in arguments ], computed by a pool of
+		parameters.kPathPoolWorkers threads if that is more than one.
+		Paths are independent of each other once the W_matrices are known,
+		and numpy and LAPACK release the GIL while they work.
+		'''
+		workers = parameters.kPathPoolWorkers
+		if workers <= 1 or len( arguments ) <= 1:
+			return [ function( *args ) for args in arguments ]
 		
+		if self.path_pool is None or self.path_pool_workers != workers:
+			## Threads rather than processes, because each path's solvers and
+			## their factorizations have to stay alive between calls.
+			from multiprocessing.pool import ThreadPool
+			if self.path_pool is not None: self.path_pool.close()
+			self.path_pool = ThreadPool( workers )
+			self.path_pool_workers = workers
+		
+		return self.path_pool.map( lambda args: function( *args ), arguments )
+	
+	def stack_linear_bases( self ):
+		'''
+		Stacks the linear bases of all paths whose solution is linear in the transforms
+		into one contiguous matrix, so that solving for all of them is one matrix-vector product.
+		Returns the matrix and, for each path, the ( begin, end ) rows of the matrix for that path,
+		or None if the path has to be solved by its fast_update function.
+		'''
+		bases = []
+		path_rows = []
+		offset = 0
+		for linear_basis in self.linear_basis_functions:
+			basis = linear_basis( self.perform_multiple_iterations )
+			if basis is None:
+				path_rows.append( None )
+			else:
+				bases.append( basis )
+				path_rows.append( ( offset, offset + len( basis ) ) )
+				offset += len( basis )
+		
+		if len( bases ) == 0:
+			return None, path_rows
+		return ascontiguousarray( concatenate( bases ) ), path_rows
 	
 	def solve_transform_change( self ):
 		'''
 		solve for the new control points when only transform changes
 		'''
+		if not self.use_linear_basis:
+			result = self.map_paths( lambda fast_update: fast_update( self.transforms, self.perform_multiple_iterations ), [ ( fast_update, ) for fast_update in self.fast_update_functions ] )
+			
+			self.solutions = result
+			return result
+		
+		## The linear basis depends on the systems, but not on the transforms,
+		## so it is only stacked once after prepare_to_solve().
+		if self.linear_basis is None:
+			self.linear_basis = self.stack_linear_bases()
+		basis, path_rows = self.linear_basis
+		
+		if basis is not None:
+			## Every handle contributes [ vec(T_i), 1 ].
+			transforms = asarray( self.transforms ).reshape( -1, 9 )
+			x = dot( basis, append( transforms, ones( ( len( transforms ), 1 ) ), axis = 1 ).ravel() )
+		
+		## Solve the paths that aren't linear in the transforms.
+		nonlinear = [ ( fast_update, ) for fast_update, rows in zip( self.fast_update_functions, path_rows ) if rows is None ]
+		nonlinear = iter( self.map_paths( lambda fast_update: fast_update( self.transforms, self.perform_multiple_iterations ), nonlinear ) )
+		
 		result = []
-		for fast_update in self.fast_update_functions:
-			result.append(	fast_update( self.transforms, self.perform_multiple_iterations ) )
+		for rows in path_rows:
+			if rows is None:
+				result.append( next( nonlinear ) )
+			else:
+				## A view, not a copy.
+				result.append( x[ rows[0] : rows[1] ].reshape( -1, 4, 2 ) )
 		
 		self.solutions = result
-
 		return result
 	
 	def set_enable_arc_length( self, is_arc_enabled ):
@@ -477,6 +544,24 @@ class YSEngine(Engine):
 	
 	def set_iterations( self, whether ):
 		self.perform_multiple_iterations = whether		
+		## Which paths are linear in the transforms depends on this.
+		self.linear_basis = None
+	
+	def get_iteration_metrics( self ):
+		'''
+		Returns a list with, for each path, a dictionary of the iteration metrics
+		kept by prepare_approximate_beziers(). Paths solved by the linear basis don't iterate,
+		so their metrics aren't updated.
+		'''
+		return [ dict( metrics ) for metrics in self.iteration_metrics ]
+	
+	def set_linear_basis( self, whether ):
+		'''
+		Solve all paths that are linear in the transforms with a single
+		matrix-vector product (True) or each path separately (False).
+		'''
+		self.use_linear_basis = whether
+		self.linear_basis = None
 			
 	def compute_energy_and_maximum_distance( self ):
 		'''
@@ -552,13 +637,38 @@ def prepare_approximate_beziers( controls, constraints, handles, transforms, len
 			odd.update_system_with_result_of_previous_iteration( sol )
 			oddfast.update_system_with_result_of_previous_iteration( sol )
 	
+	## Iteration metrics, updated by every call to update_with_transforms().
+	solvers = [ oddfast ] + ( [ odd, even ] if 'A' in smoothness or 'G1' in smoothness else [] )
+	metrics = {
+		## The number of calls to update_with_transforms().
+		'updates': 0,
+		## The number of solves in the last call, and in all calls.
+		'iterations': 0,
+		'total_iterations': 0,
+		## The largest control point movement in the last iteration of the last call.
+		'residual': None,
+		'symbolic_factorizations': 0,
+		'symbolic_factorizations_avoided': 0
+		}
+	
+	def update_metrics( iteration, residual ):
+		metrics['updates'] += 1
+		metrics['iterations'] = iteration
+		metrics['total_iterations'] += iteration
+		metrics['residual'] = residual
+		metrics['symbolic_factorizations'] = sum([ solver.symbolic_factorizations for solver in solvers ])
+		metrics['symbolic_factorizations_avoided'] = sum([ solver.symbolic_factorizations_avoided for solver in solvers ])
+	
 	def update_with_transforms( transforms, multiple_iterations = True ):
 		#multiple_iterations = False
 		if not multiple_iterations or not ( 'A' in smoothness or 'G1' in smoothness ):
 			oddfast.update_rhs_for_handles( transforms )
-			return oddfast.solve()
+			solutions = oddfast.solve()
+			update_metrics( 1, None )
+			return solutions
 		
 		iteration = 1
+		residual = None
 		odd.update_rhs_for_handles( transforms )
 		last_odd_solutions = solutions = odd.solve()
 		if not multiple_iterations: return solutions
@@ -590,6 +700,7 @@ def prepare_approximate_beziers( controls, constraints, handles, transforms, len
 				#print 'max |last solutions - solutions|:', abs( asarray( last_solutions ) - asarray( solutions ) ).max()
 				#from pprint import pprint
 				#pprint( solutions )
+				residual = abs( asarray( last_odd_solutions ) - asarray( solutions ) ).max()
 				if allclose(last_odd_solutions, solutions, atol=1.0, rtol=1e-03):
 				    break
 				if last_even_solutions is not None and allclose(last_even_solutions, solutions, atol=1.0, rtol=1e-03):
@@ -608,6 +719,7 @@ def prepare_approximate_beziers( controls, constraints, handles, transforms, len
 				
 				#print 'max |last solutions - solutions|:', abs( asarray( last_solutions ) - asarray( solutions ) ).max()
 				#pprint( solutions )
+				residual = abs( asarray( last_even_solutions ) - asarray( solutions ) ).max()
 				if allclose(last_even_solutions, solutions, atol=1.0, rtol=1e-03):
 					break
 				if allclose(last_odd_solutions, solutions, atol=1.0, rtol=1e-03):
@@ -615,15 +727,38 @@ def prepare_approximate_beziers( controls, constraints, handles, transforms, len
 				
 				last_odd_solutions = solutions
 		
-		print 'iterations:', iteration
 		if not parameters.kGatheringTiming:
 			oddfast.update_system_with_result_of_previous_iteration( solutions )
+		
+		update_metrics( iteration, residual )
 		return solutions
 	
-	return update_with_transforms					
+	def linear_basis( multiple_iterations = True ):
+		'''
+		If update_with_transforms( transforms, multiple_iterations ) is linear in the transforms,
+		returns the matrix from BezierConstraintSolverOddFast.linear_basis() that computes it.
+		Otherwise, returns None.
+		'''
+		if parameters.kClampOn: return None
+		if multiple_iterations and ( 'A' in smoothness or 'G1' in smoothness ): return None
+		return oddfast.linear_basis()
+	
+	return update_with_transforms, linear_basis, metrics
 	
 
-def precompute_all_when_configuration_change( boundary_index, all_control_positions, skeleton_handle_vertices, weight_function = 'bbw', kArcLength=False ):
+def all_arrays_equal( old, new ):
+	'''
+	Returns whether the lists of arrays 'old' and 'new' have the same length
+	and each of their items is array_equal().
+	NOTE: This is a loop rather than all( ... ), because 'all' is numpy.all() here,
+	      which doesn't evaluate generators.
+	'''
+	if len( old ) != len( new ): return False
+	for old_item, new_item in zip( old, new ):
+		if not array_equal( old_item, new_item ): return False
+	return True
+
+def precompute_all_when_configuration_change( boundary_index, all_control_positions, skeleton_handle_vertices, weight_function = 'bbw', kArcLength=False, previous = None ):
 	'''
 	precompute everything when the configuration changes, in other words, when the number of control points and handles change.
 	W_matrices is the table contains all integral result corresponding to each sample point on the boundaries.
@@ -631,45 +766,81 @@ def precompute_all_when_configuration_change( boundary_index, all_control_positi
 	all_vertices is an array of positions of all sampling points. It contains no duplicated points, and matches to all_weights one-on-one
 	all_indices is an array of all indices in all_vertices of those sampling points on the boundaries(the curves we need to compute).
 	all_pts is an array containing all sampling points and ts for each curve.(boundaries)
-	all_dts contains all dts for each curve. It is in the shape of num_curve-by-(num_samples-1)
+	all_dts contains all dts for each curve. Each has num_samples-1 entries, or num_samples with parameters.kGaussLegendrePoints.
+	
+	If 'previous' is the layer returned by an earlier call, only what depends on
+	the arguments that changed is recomputed. In particular, if only the handles changed,
+	the sampling is reused, and Shepard weights only compute a column for each handle that moved.
 	'''
-	num_samples = 100
-	all_pts = []
-	all_dts = []
-	all_ts = []
-	all_lengths = []
-	for control_pos in all_control_positions:
-		path_pts, path_ts, path_dts = sample_cubic_bezier_curve_chain( control_pos, num_samples )
-		all_pts.append( path_pts )
-		all_ts.append( path_ts )
-		
-		## Compute all_lengths
-		path_dss = [ map( mag, ( curve_pts[1:] - curve_pts[:-1] ) ) for curve_pts in path_pts ]
-		path_dss = asarray( path_dss )
-		path_lengths = [ sum( path_dss[i] ) for i in range( len( path_dss ) ) ]
-		all_lengths.append( path_lengths )
-		## Then normalize dss
-		dss = [ ds / length for ds, length in zip( path_dss, path_lengths ) ]
-		
-		
-		if kArcLength:
-			all_dts.append( path_dss )
-		else:
-			all_dts.append( path_dts )
-
+	all_control_positions = [ asarray( control_pos ).copy() for control_pos in all_control_positions ]
+	skeleton_handle_vertices = asarray( skeleton_handle_vertices )
 	
-	all_vertices, all_weights, all_indices = compute_all_weights( all_pts, skeleton_handle_vertices, boundary_index, weight_function )
+	same_sampling = (
+		previous is not None
+		and previous.kArcLength == kArcLength
+		and previous.sample_tolerance == parameters.kSampleTolerance
+		and previous.gauss_points == parameters.kGaussLegendrePoints
+		and all_arrays_equal( previous.all_control_positions, all_control_positions )
+		)
+	same_weights = (
+		same_sampling
+		and previous.boundary_index == boundary_index
+		and previous.weight_function == weight_function
+		and array_equal( previous.skeleton_handle_vertices, skeleton_handle_vertices )
+		)
+	if same_weights:
+		return previous
+	
+	if same_sampling:
+		all_pts = previous.all_pts
+		all_dts = previous.all_dts
+		all_ts = previous.all_ts
+		all_lengths = previous.all_lengths
+	else:
+		num_samples = 100
+		all_pts = []
+		all_dts = []
+		all_ts = []
+		all_lengths = []
+		for control_pos in all_control_positions:
+			path_pts, path_ts, path_dts = sample_cubic_bezier_curve_chain( control_pos, num_samples, parameters.kSampleTolerance, parameters.kGaussLegendrePoints )
+			all_pts.append( path_pts )
+			all_ts.append( path_ts )
+			
+			## Compute all_lengths
+			path_dss = sample_arc_length_dts( control_pos, path_pts, path_ts, path_dts )
+			path_lengths = asarray( [ curve_dss.sum() for curve_dss in path_dss ] )
+			all_lengths.append( path_lengths )
+			
+			if kArcLength:
+				all_dts.append( path_dss )
+			else:
+				all_dts.append( path_dts )
+	
+	distances = None
+	if 'shepard' == weight_function and same_sampling and previous.shepard_distances is not None:
+		## Shepard weights don't triangulate, so the vertices and indices only depend on the sampling,
+		## and each handle's column of squared distances only depends on that handle.
+		all_vertices, all_indices = previous.all_vertices, previous.all_indices
+		distances = shepard_distances( all_vertices, skeleton_handle_vertices[:, :2], previous.skeleton_handle_vertices[:, :2], previous.shepard_distances )
+		all_weights = shepard_from_distances( distances )
+	else:
+		all_vertices, all_weights, all_indices = compute_all_weights( all_pts, skeleton_handle_vertices, boundary_index, weight_function )
+		if 'shepard' == weight_function:
+			distances = shepard_distances( all_vertices, skeleton_handle_vertices[:, :2] )
 	
 	tic( 'Precomputing W_i...' )
-	W_matrices = []
-	for j, control_pos in enumerate( all_control_positions ):
-		W_matrices.append( zeros( ( len( control_pos ), len( skeleton_handle_vertices ), 4, 4 ) ) )		
-		for k in xrange(len( control_pos )):	
-			for i in xrange(len( skeleton_handle_vertices )):
-				## indices k, i, 0 is integral of w*tbar*tbar.T, used for C0, C1, G1,
-				## indices k, i, 1 is integral of w*tbar*(M*tbar), used for G1
-				W_matrices[j][k,i] = precompute_W_i( all_vertices, all_weights, i, all_indices[j][k], all_pts[j][k], all_ts[j][k], all_dts[j][k])
-				
+	## The part of W_i that only depends on the sampling can be reused if the sampling indices are the same.
+	## The same sampling has the same number of curves in each path, so it's enough to compare the curves.
+	if same_sampling and all_arrays_equal(
+			[ curve_indices for path_indices in previous.all_indices for curve_indices in path_indices ],
+			[ curve_indices for path_indices in all_indices for curve_indices in path_indices ]
+			):
+		sample_factors = previous.sample_factors
+	else:
+		sample_factors = precompute_W_sample_factors( all_indices, all_ts, all_dts )
+	## W_matrices[j][k,i] is precompute_W_i() for path j, curve k, and handle i.
+	W_matrices = precompute_all_W_fast( all_weights, all_indices, all_ts, all_dts, sample_factors )
 	W_matrices = asarray( W_matrices )
 	toc()
 	
@@ -683,10 +854,18 @@ def precompute_all_when_configuration_change( boundary_index, all_control_positi
 	layer.all_dts = all_dts
 	layer.all_ts = all_ts
 	layer.all_lengths = all_lengths
+	## What the layer was computed from, for the next call's 'previous'.
+	layer.boundary_index = boundary_index
+	layer.all_control_positions = all_control_positions
+	layer.skeleton_handle_vertices = skeleton_handle_vertices
+	layer.weight_function = weight_function
+	layer.kArcLength = kArcLength
+	layer.sample_tolerance = parameters.kSampleTolerance
+	layer.gauss_points = parameters.kGaussLegendrePoints
+	layer.shepard_distances = distances
+	layer.sample_factors = sample_factors
 	return layer
 
-	
-
 def get_test1():
 	
 	paths_info =  [
@@ -924,6 +1103,55 @@ def test_simple():
 	
 	print distances
 	print 'HAHA ~ '
+
+def test_incremental_precompute( weight_function = 'bbw' ):
+	'''
+	Checks that precompute_configuration() reusing the previous layer gives the same layer and solutions
+	as precomputing from scratch, after adding handles, moving a handle, and editing the control points.
+	'''
+	paths_info, skeleton_handle_vertices, constraint = get_test_alligator()
+	
+	engine = YSEngine()
+	engine.init_engine( paths_info, argmax([ info['bbox_area'] for info in paths_info if info['closed'] ]) )
+	engine.weight_function = weight_function
+	
+	def check( what ):
+		engine.precompute_configuration()
+		incremental = engine.precomputed_parameter_table[0]
+		engine.prepare_to_solve()
+		incremental_solutions = [ asarray( path ).copy() for path in engine.solve_transform_change() ]
+		
+		engine.precomputed_parameter_table = []
+		engine.precompute_configuration()
+		scratch = engine.precomputed_parameter_table[0]
+		engine.prepare_to_solve()
+		scratch_solutions = engine.solve_transform_change()
+		
+		assert allclose( incremental.all_weights, scratch.all_weights ), what
+		for i in xrange( engine.num_of_paths ):
+			assert allclose( incremental.W_matrices[i], scratch.W_matrices[i] ), what
+			assert all_arrays_equal( incremental.all_pts[i], scratch.all_pts[i] ), what
+			assert allclose( incremental_solutions[i], scratch_solutions[i] ), what
+		print 'incremental precompute matches after', what
+	
+	## Add the handles one at a time.
+	for i in xrange( 1, len( skeleton_handle_vertices ) + 1 ):
+		engine.set_handle_positions( skeleton_handle_vertices[:i] )
+		if i > 1: check( 'adding handle %s' % ( i-1, ) )
+		else: engine.precompute_configuration()
+	
+	## Move a handle.
+	handles = asarray( skeleton_handle_vertices, dtype = float )
+	handles[0] += ( 15., -10. )
+	engine.set_handle_positions( handles )
+	check( 'moving a handle' )
+	
+	## Edit the control points.
+	engine.all_controls = [ asarray( controls ) * 1.5 for controls in engine.all_controls ]
+	engine.set_handle_positions( handles * 1.5 )
+	check( 'scaling the control points and handles' )
+	engine.all_controls = [ asarray( controls ) + ( 3., 4. ) for controls in engine.all_controls ]
+	check( 'translating the control points' )
 		
 
 def main():
@@ -933,6 +1161,7 @@ def main():
 	
 	#test_fancy()
 	#test_simple()
+	#test_incremental_precompute()
 	test_actually_solve()
 
 
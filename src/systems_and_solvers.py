@@ -2,6 +2,151 @@ import numpy
 
 kDefaultSystemSolvePackage = 'scipy'
 kDefaultBuildType = 'numpy'
+## Systems at least this large use the 'banded' solver with 'blocks' building.
+kBandedMinimumSystemSize = 2000
+
+class BlockSystem( object ):
+    '''
+    A matrix-like triplet (coo) assembler that stores only the dense blocks assigned to it,
+    so memory grows with the number of curves rather than with system_size**2.
+    Supports the slice assignment used to build the system matrices:
+        system[ r0 : r1, c0 : c1 ] = small_block
+    
+    The row and column indices of a block are recorded the first time it is assigned.
+    Assigning to the same position again only rewrites the block's values in place,
+    so re-assembling a system with an unchanged sparsity pattern never reallocates,
+    and tocsc() can reuse the compressed column structure it computed last time.
+    Blocks should not overlap; overlapping entries are summed.
+    '''
+    
+    def __init__( self, shape ):
+        self.shape = tuple( shape )
+        ## Maps a block's ( first row, first column ) to ( its offset into self.data, its shape ).
+        self.slots = {}
+        self.size = 0
+        self.data = numpy.zeros( 64 )
+        self.rows = numpy.zeros( 64, dtype = int )
+        self.cols = numpy.zeros( 64, dtype = int )
+        ## Incremented whenever the sparsity pattern changes.
+        self.pattern_version = 0
+        self.csc_pattern = None
+        self.fingerprint = None
+    
+    def __setitem__( self, index, value ):
+        rows, cols = index
+        r0, r1, rstep = rows.indices( self.shape[0] )
+        c0, c1, cstep = cols.indices( self.shape[1] )
+        assert rstep == 1 and cstep == 1
+        
+        if r1 <= r0 or c1 <= c0: return
+        block_shape = ( r1 - r0, c1 - c0 )
+        value = numpy.asarray( value, dtype = float ).reshape( block_shape )
+        
+        slot = self.slots.get( ( r0, c0 ) )
+        if slot is not None and slot[1] == block_shape:
+            self.data[ slot[0] : slot[0] + value.size ] = value.ravel()
+            return
+        
+        ## A block that changes shape leaves its old entries behind as explicit zeros.
+        if slot is not None:
+            self.data[ slot[0] : slot[0] + slot[1][0]*slot[1][1] ] = 0.
+        
+        start = self.size
+        end = start + value.size
+        if end > len( self.data ):
+            capacity = max( 2*len( self.data ), end )
+            self.data = numpy.resize( self.data, capacity )
+            self.rows = numpy.resize( self.rows, capacity )
+            self.cols = numpy.resize( self.cols, capacity )
+        
+        r, c = numpy.indices( block_shape )
+        self.rows[ start : end ] = ( r + r0 ).ravel()
+        self.cols[ start : end ] = ( c + c0 ).ravel()
+        self.data[ start : end ] = value.ravel()
+        self.size = end
+        
+        self.slots[ ( r0, c0 ) ] = ( start, block_shape )
+        self.pattern_version += 1
+    
+    def tocoo( self ):
+        '''
+        Returns a scipy.sparse.coo_matrix containing every entry of every block,
+        including zeros inside a block, so that the sparsity pattern only depends
+        on where blocks were assigned and not on their values.
+        '''
+        import scipy.sparse
+        
+        n = self.size
+        return scipy.sparse.coo_matrix(
+            ( self.data[ :n ].copy(), ( self.rows[ :n ], self.cols[ :n ] ) ),
+            shape = self.shape
+            )
+    
+    def tocsc( self ):
+        '''
+        Returns a scipy.sparse.csc_matrix with the same (structural) entries as tocoo().
+        The compressed column structure is only recomputed when the sparsity pattern changes;
+        otherwise this just scatters the current values into place.
+        '''
+        import scipy.sparse
+        
+        n = self.size
+        if self.csc_pattern is None or self.csc_pattern[0] != self.pattern_version:
+            rows = self.rows[ :n ]
+            cols = self.cols[ :n ]
+            ## Sort by column and then by row, and merge duplicate entries.
+            order = numpy.lexsort( ( rows, cols ) )
+            sorted_rows = rows[ order ]
+            sorted_cols = cols[ order ]
+            first = numpy.ones( n, dtype = bool )
+            first[ 1: ] = ( sorted_rows[ 1: ] != sorted_rows[ :-1 ] ) | ( sorted_cols[ 1: ] != sorted_cols[ :-1 ] )
+            ## 'target[i]' is the position of triplet i in the csc data array.
+            target = numpy.empty( n, dtype = int )
+            target[ order ] = numpy.cumsum( first ) - 1
+            indices = sorted_rows[ first ]
+            indptr = numpy.concatenate( ( [0], numpy.cumsum( numpy.bincount( sorted_cols[ first ], minlength = self.shape[1] ) ) ) )
+            self.csc_pattern = ( self.pattern_version, target, indices, indptr )
+        
+        version, target, indices, indptr = self.csc_pattern
+        data = numpy.bincount( target, weights = self.data[ :n ], minlength = len( indices ) )
+        return scipy.sparse.csc_matrix( ( data, indices, indptr ), shape = self.shape )
+
+def structural_fingerprint( system ):
+    '''
+    Given a system matrix of any build type, returns a hashable value that is the same
+    for two systems exactly when their sparsity patterns are the same,
+    so that a symbolic factorization computed for one can be reused for the other.
+    
+    Every entry of every block assigned to a BlockSystem is structural, even if it is zero,
+    so lagrange entries that happen to vanish (e.g. a fixed direction along a coordinate axis)
+    don't change the fingerprint. The other build types only know their pattern
+    through their nonzeros, which is also what their conversion to the solve type sees.
+    '''
+    if isinstance( system, BlockSystem ):
+        if system.fingerprint is None or system.fingerprint[0] != system.pattern_version:
+            n = system.size
+            system.fingerprint = ( system.pattern_version, hash( ( system.shape, system.rows[ :n ].tostring(), system.cols[ :n ].tostring() ) ) )
+        return system.fingerprint[1]
+    
+    if hasattr( system, 'V' ):
+        ## cvxopt.spmatrix
+        nonzero = numpy.asarray( system.V ).ravel() != 0
+        rows = numpy.asarray( system.I ).ravel()[ nonzero ]
+        cols = numpy.asarray( system.J ).ravel()[ nonzero ]
+        shape = system.size
+    elif isinstance( system, numpy.ndarray ):
+        ## A dense matrix's nonzero mask is already in a canonical order.
+        return hash( ( system.shape, numpy.packbits( system != 0 ).tostring() ) )
+    else:
+        system = system.tocoo()
+        nonzero = system.data != 0
+        rows = system.row[ nonzero ]
+        cols = system.col[ nonzero ]
+        shape = system.shape
+    
+    ## Sort so that the order in which entries were stored doesn't matter.
+    order = numpy.lexsort( ( rows, cols ) )
+    return hash( ( tuple( shape ), numpy.asarray( rows[ order ], dtype = int ).tostring(), numpy.asarray( cols[ order ], dtype = int ).tostring() ) )
 
 def get_system_and_factor_funcs_for_system_size( system_size, G1orA ):
     '''
@@ -22,11 +167,15 @@ def get_system_and_factor_funcs_for_system_size( system_size, G1orA ):
     
     if G1orA and system_size < 200:
         return get_system_and_factor_funcs( 'numpy-inv', 'numpy' )
+    elif system_size >= kBandedMinimumSystemSize:
+        ## Long chains (e.g. get_test_infinite(1000)) can't even allocate a dense matrix.
+        ## Only store the blocks and solve with a banded LU factorization.
+        return get_system_and_factor_funcs( 'banded', 'blocks' )
     else:
-        ## This is the best up to even our largest examples (despite being a dense matrix)
-        ## and down to our smallest systems (provided that the same matrix factorization
-        ## is used for many right-hand-sides).
-        return get_system_and_factor_funcs( 'scipy', 'numpy' )
+        ## This used to be 'numpy' building (a dense matrix converted to csc on every
+        ## refactorization). Assembling the blocks as triplets avoids the O(n^2)
+        ## allocation and conversion, which dominated the even/odd iterations.
+        return get_system_and_factor_funcs( 'scipy', 'blocks' )
 
 def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
     '''
@@ -46,10 +195,15 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
     if build_system_type is None: build_system_type = kDefaultBuildType
     
     if 'scipy' == solver_type or 'scipy' == build_system_type: import scipy.sparse.linalg
+    if 'banded' == solver_type:
+        import scipy.sparse, scipy.linalg.lapack
+        from scipy.sparse.csgraph import reverse_cuthill_mckee
     if 'cvxopt' == solver_type or 'cvxopt' == build_system_type: import cvxopt
     
     if 'numpy' == build_system_type:
         zeros_system_build_t = numpy.zeros
+    elif 'blocks' == build_system_type:
+        zeros_system_build_t = BlockSystem
     elif 'scipy' == build_system_type:
         zeros_system_build_t = scipy.sparse.lil_matrix
     elif 'cvxopt' == build_system_type:
@@ -65,6 +219,8 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
     if 'numpy-inv' == solver_type:
         if 'numpy' == build_system_type:
             to_system_solve_t = lambda x: x
+        elif 'blocks' == build_system_type:
+            to_system_solve_t = lambda x: x.tocoo().toarray()
         elif 'scipy' == build_system_type:
             to_system_solve_t = lambda x: asarray( x.todense() )
         elif 'cvxopt' == build_system_type:
@@ -95,6 +251,8 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
     elif 'numpy-solve' == solver_type:
         if 'numpy' == build_system_type:
             to_system_solve_t = lambda x: x
+        elif 'blocks' == build_system_type:
+            to_system_solve_t = lambda x: x.tocoo().toarray()
         elif 'scipy' == build_system_type:
             to_system_solve_t = lambda x: asarray( x.todense() )
         elif 'cvxopt' == build_system_type:
@@ -120,6 +278,8 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
     elif 'scipy' == solver_type:
         if 'numpy' == build_system_type:
             to_system_solve_t = scipy.sparse.csc_matrix
+        elif 'blocks' == build_system_type:
+            to_system_solve_t = lambda x: x.tocsc()
         elif 'scipy' == build_system_type:
             to_system_solve_t = scipy.sparse.csc_matrix
         elif 'cvxopt' == build_system_type:
@@ -134,13 +294,108 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
                 system * x = b
             as follows:
                 x = compute_symbolic_factorization( system )( system )( b )
+            
+            The symbolic step is SuperLU's fill-reducing column ordering (COLAMD).
+            The numeric step keeps that ordering, so refactoring a system whose
+            sparsity pattern hasn't changed skips the ordering analysis.
             '''
+            first = scipy.sparse.linalg.splu( system )
+            ## SuperLU factors A*Pc, where Pc[ i, perm_c[i] ] = 1, so A*Pc = A[ :, argsort( perm_c ) ].
+            column_order = numpy.argsort( first.perm_c )
+            ## The first numeric factorization is the one we just computed.
+            unused = [ ( system, first ) ]
+            indptr = system.indptr.copy()
+            indices = system.indices.copy()
+            ## Permuting the columns of a csc matrix only moves whole columns of its data,
+            ## so where each entry of A*Pc comes from is found once, when first needed.
+            permuted_pattern = []
+            
             def compute_numeric_factorization( system ):
-                factorized = scipy.sparse.linalg.factorized( system )
-                def solve( rhs ):
-                    ## spsolve() is slower than the factorized above.
+                if len( unused ) > 0 and unused[0][0] is system:
+                    ## spsolve() is slower than reusing a factorization.
                     # return scipy.sparse.linalg.spsolve( system, rhs )
-                    return factorized( rhs )
+                    return unused.pop()[1].solve
+                del unused[:]
+                
+                ## The caller promises the same sparsity pattern as the symbolic system.
+                ## If it isn't, the saved column ordering doesn't apply,
+                ## so factor this system from scratch instead.
+                if not ( numpy.array_equal( system.indptr, indptr ) and numpy.array_equal( system.indices, indices ) ):
+                    return scipy.sparse.linalg.splu( system ).solve
+                if len( permuted_pattern ) == 0:
+                    counts = numpy.diff( indptr )[ column_order ]
+                    permuted_indptr = numpy.concatenate( ( [0], numpy.cumsum( counts ) ) )
+                    gather = numpy.repeat( indptr[ column_order ] - permuted_indptr[ :-1 ], counts ) + numpy.arange( permuted_indptr[-1] )
+                    permuted_pattern.extend( ( gather, indices[ gather ], permuted_indptr ) )
+                gather, permuted_indices, permuted_indptr = permuted_pattern
+                
+                permuted = scipy.sparse.csc_matrix( ( system.data[ gather ], permuted_indices, permuted_indptr ), shape = system.shape )
+                lu = scipy.sparse.linalg.splu( permuted, permc_spec = 'NATURAL' )
+                def solve( rhs ):
+                    rhs = numpy.asarray( rhs )
+                    result = numpy.empty( rhs.shape )
+                    result[ column_order ] = lu.solve( rhs )
+                    return result
+                return solve
+            return compute_numeric_factorization
+    
+    elif 'banded' == solver_type:
+        if 'numpy' == build_system_type:
+            to_system_solve_t = scipy.sparse.coo_matrix
+        elif 'blocks' == build_system_type:
+            to_system_solve_t = lambda x: x.tocoo()
+        elif 'scipy' == build_system_type:
+            to_system_solve_t = lambda x: x.tocoo()
+        elif 'cvxopt' == build_system_type:
+            to_system_solve_t = cvx2scipy
+        else:
+            raise RuntimeError( "Unknown build dense type: " + str( build_system_type ) )
+        
+        def compute_symbolic_factorization( system ):
+            '''
+            Given a scipy.sparse.coo_matrix system matrix 'system',
+            return a function that can be used to solve for 'x' in
+                system * x = b
+            as follows:
+                x = compute_symbolic_factorization( system )( system )( b )
+            
+            The symbolic step finds a reverse Cuthill-McKee ordering of the sparsity pattern.
+            Each curve only couples to its neighbors through the lagrange rows,
+            so the reordered system is block-tridiagonal. For closed chains,
+            the ordering folds the cyclic corner block into the band, roughly doubling its width.
+            The numeric step is then a banded LU factorization (LAPACK gbtrf),
+            which is O(n) in time and memory for a fixed bandwidth.
+            '''
+            n = system.shape[0]
+            pattern = scipy.sparse.csr_matrix( ( numpy.ones( len( system.data ) ), ( system.row, system.col ) ), shape = system.shape )
+            perm = reverse_cuthill_mckee( pattern, symmetric_mode = True )
+            inverse_perm = numpy.empty( n, dtype = int )
+            inverse_perm[ perm ] = numpy.arange( n )
+            
+            offsets = inverse_perm[ system.row ] - inverse_perm[ system.col ]
+            kl = max( offsets.max(), 0 ) if len( offsets ) > 0 else 0
+            ku = max( -offsets.min(), 0 ) if len( offsets ) > 0 else 0
+            
+            def compute_numeric_factorization( system ):
+                rows = inverse_perm[ system.row ]
+                cols = inverse_perm[ system.col ]
+                assert ( rows - cols ).max() <= kl and ( cols - rows ).max() <= ku
+                
+                ## LAPACK band storage with room for the fill-in from row pivoting.
+                ab = numpy.zeros( ( 2*kl + ku + 1, n ) )
+                ## Accumulate, because coo matrices may contain duplicate entries.
+                numpy.add.at( ab, ( kl + ku + rows - cols, cols ), system.data )
+                lu, piv, info = scipy.linalg.lapack.dgbtrf( ab, kl, ku, overwrite_ab = 1 )
+                if info > 0:
+                    raise RuntimeError( "Factor is exactly singular" )
+                
+                def solve( rhs ):
+                    rhs = numpy.asarray( rhs )
+                    b = rhs[ perm ].reshape( n, -1 )
+                    x, info = scipy.linalg.lapack.dgbtrs( lu, kl, ku, b, piv )
+                    result = numpy.empty( x.shape )
+                    result[ perm ] = x
+                    return result.reshape( rhs.shape )
                 return solve
             return compute_numeric_factorization
     
@@ -151,6 +406,8 @@ def get_system_and_factor_funcs( solver_type = None, build_system_type = None ):
         
         if 'numpy' == build_system_type:
             to_system_solve_t = lambda x: cvxopt.sparse( cvxopt.matrix( x ) )
+        elif 'blocks' == build_system_type:
+            to_system_solve_t = lambda x: scipy2cvx( x.tocoo() )
         elif 'scipy' == build_system_type:
             to_system_solve_t = scipy2cvx
         elif 'cvxopt' == build_system_type:
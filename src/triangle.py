@@ -6,14 +6,116 @@ from numpy import asarray
 #triangle_path = os.path.join( "C:\\Users\\Mai\\Dropbox\\Research\\Deformation\\src\\py\\triangle", "triangle.exe")
 triangle_path = os.path.join( os.path.dirname( __file__ ), "triangle", "triangle" )
 
-if not os.path.exists( triangle_path ):
+## Triangle compiled as a shared library (see 'make sharedlib' in the triangle directory),
+## which lets us call triangulate() directly instead of running 'triangle_path' on temporary files.
+def platform_shared_library_suffix():
+    result = '.so'
+    if 'win' in sys.platform.lower(): result = '.dll'
+    ## No else if, because we want darwin to override win (which is a substring of darwin)
+    if 'darwin' in sys.platform.lower(): result = '.dylib'
+    return result
+
+triangle_library_path = os.path.join( os.path.dirname( __file__ ), "triangle", "libtriangle" + platform_shared_library_suffix() )
+
+try:
+    from cffi import FFI
+    
+    ffi = FFI()
+    ffi.cdef("""
+    struct triangulateio {
+      double *pointlist;
+      double *pointattributelist;
+      int *pointmarkerlist;
+      int numberofpoints;
+      int numberofpointattributes;
+      
+      int *trianglelist;
+      double *triangleattributelist;
+      double *trianglearealist;
+      int *neighborlist;
+      int numberoftriangles;
+      int numberofcorners;
+      int numberoftriangleattributes;
+      
+      int *segmentlist;
+      int *segmentmarkerlist;
+      int numberofsegments;
+      
+      double *holelist;
+      int numberofholes;
+      
+      double *regionlist;
+      int numberofregions;
+      
+      int *edgelist;
+      int *edgemarkerlist;
+      double *normlist;
+      int numberofedges;
+    };
+    
+    void triangulate( char *, struct triangulateio *, struct triangulateio *, struct triangulateio * );
+    void trifree( void *memptr );
+    """)
+    
+    libtriangle = ffi.dlopen( triangle_library_path )
+except ( ImportError, OSError ):
+    libtriangle = None
+
+if libtriangle is None and not os.path.exists( triangle_path ):
     raise ImportError, "Triangle not found: " + triangle_path
 
 
-def triangles_for_points( points, boundary_edges = None ):
+### http://www.cs.cmu.edu/~quake/triangle.switch.html
+## -q Quality mesh generation with no angles smaller than 20 degrees. An alternate minimum angle may be specified after the `q'.
+## -a Imposes a maximum triangle area constraint. A fixed area constraint (that applies to every triangle) may be specified after the `a', or varying area constraints may be read from a .poly file or .area file.
+## -g Outputs the mesh to an Object File Format (.off) file, suitable for viewing with the Geometry Center's Geomview package.
+triangle_options = [ '-q', '-a100', '-g' ]
+# triangle_options = [ '-q' ]
+
+def triangle_options_for_vertex_budget( points, vertex_budget, options = None ):
+    '''
+    Given a sequence of 2D points 'points', a target number of mesh vertices 'vertex_budget',
+    and an optional list of command line switches 'options' (default: 'triangle_options'),
+    returns 'options' with the maximum triangle area (-a) chosen so that
+    a mesh filling the bounding box of 'points' has at most about 'vertex_budget' vertices.
+    If 'vertex_budget' is None or the bounding box is degenerate, returns 'options' unchanged.
+    '''
+    
+    if options is None: options = triangle_options
+    
+    points = asarray( points )
+    if vertex_budget is None or len( points ) == 0: return list( options )
+    
+    bbox_area = ( points[:,0].max() - points[:,0].min() ) * ( points[:,1].max() - points[:,1].min() )
+    if not bbox_area > 0: return list( options )
+    
+    ## With -q, Triangle makes about two triangles per vertex, and the average triangle
+    ## ends up with a bit more than half the maximum area, so a region meshes to
+    ## a little under one vertex per maximum area.
+    max_area = bbox_area / max( vertex_budget, 1 )
+    
+    return [ option for option in options if not option.startswith( '-a' ) ] + [ '-a' + triangle_number( max_area ) ]
+
+def triangle_number( x ):
+    '''
+    Given a positive number 'x', returns it as a string for a Triangle switch such as -a.
+    Triangle only reads digits and '.', so the number is written in fixed-point notation
+    with enough digits after the point to keep about 15 significant digits, and never with an exponent.
+    '''
+    
+    from math import floor, log10
+    
+    digits = max( 1, 15 - int( floor( log10( x ) ) ) )
+    result = ( '%.*f' % ( digits, x ) ).rstrip( '0' )
+    if result.endswith( '.' ): result += '0'
+    return result
+
+def triangles_for_points( points, boundary_edges = None, options = None ):
     '''
     Given a sequence of 2D points 'points' and
     optional sequence of 2-tuples of indices into 'points' 'boundary_edges',
+    and an optional list of command line switches 'options' for 'triangle'
+    (default: 'triangle_options'),
     returns a triangulation of the points as a sequence
     of length-three tuples ( i, j, k ) where i,j,k are
     the indices of the triangle's vertices in 'points'.
@@ -25,34 +127,92 @@ def triangles_for_points( points, boundary_edges = None ):
     
     import os, subprocess
     
-    ### http://www.cs.cmu.edu/~quake/triangle.switch.html
-    ## -q Quality mesh generation with no angles smaller than 20 degrees. An alternate minimum angle may be specified after the `q'.
-    ## -a Imposes a maximum triangle area constraint. A fixed area constraint (that applies to every triangle) may be specified after the `a', or varying area constraints may be read from a .poly file or .area file.
-    ## -g Outputs the mesh to an Object File Format (.off) file, suitable for viewing with the Geometry Center's Geomview package.
-    options = [ '-q', '-a100', '-g' ]
-    # options = [ '-q' ]
+    if options is None: options = triangle_options
     
     if boundary_edges is None: boundary_edges = []
     
+    if libtriangle is not None:
+        return triangulate_in_process( points, boundary_edges, options )
+    
     if len( boundary_edges ) == 0:
         input_path = write_node_file( points )
-        print triangle_path, input_path
-        subprocess.call( [ triangle_path ] + options + [ input_path ] )
     else:
         input_path = write_poly_file( points, boundary_edges )
-        ## -p Triangulates a Planar Straight Line Graph (.poly file).
-        subprocess.call( [ triangle_path ] + options + [ '-p', input_path ] )
     
-    ele_path = os.path.splitext( input_path )[0] + '.1.ele'
-    triangles = read_ele_file( ele_path )
+    try:
+        if len( boundary_edges ) == 0:
+            subprocess.call( [ triangle_path ] + options + [ input_path ] )
+        else:
+            ## -p Triangulates a Planar Straight Line Graph (.poly file).
+            subprocess.call( [ triangle_path ] + options + [ '-p', input_path ] )
+        
+        ele_path = os.path.splitext( input_path )[0] + '.1.ele'
+        triangles = read_ele_file( ele_path )
+        
+        node_path = os.path.splitext( input_path )[0] + '.1.node'
+        points = read_node_file( node_path)
+    finally:
+        remove_triangle_files( input_path )
+    
+    return points, triangles
 
-    node_path = os.path.splitext( input_path )[0] + '.1.node'
-    points = read_node_file( node_path)
+def remove_triangle_files( input_path ):
+    '''
+    Given the path to a file passed to 'triangle',
+    removes it and every file 'triangle' wrote next to it
+    (.1.node, .1.ele, .1.poly, .1.off, ...).
+    '''
     
-    #os.remove( poly_path )
-    #os.remove( ele_path )
+    import glob
     
-    return points, triangles
+    ## The input paths come from tempfile.mkstemp(), so nothing else shares their base name.
+    for path in glob.glob( os.path.splitext( input_path )[0] + '.*' ):
+        try:
+            os.remove( path )
+        except OSError:
+            pass
+
+def triangulate_in_process( points, boundary_edges, options ):
+    '''
+    The same as triangles_for_points(), but calls triangulate() in 'libtriangle'
+    on the numpy buffers directly, and returns
+    an N-by-2 numpy.array of points and an M-by-3 numpy.array of triangle vertex indices.
+    '''
+    
+    import numpy
+    
+    points = numpy.ascontiguousarray( numpy.asarray( points, dtype = float )[:, :2] )
+    boundary_edges = numpy.ascontiguousarray( numpy.asarray( boundary_edges, dtype = numpy.intc ).reshape( -1, 2 ) )
+    assert points.shape[0] > 0
+    
+    ## The same switches as on the command line, minus the ones about files.
+    ## -z Numbers all items starting from zero.
+    ## -Q Quiet.
+    ## -p Triangulates a Planar Straight Line Graph.
+    switches = ''.join([ option.lstrip( '-' ) for option in options if option != '-g' ]) + 'zQ'
+    if len( boundary_edges ) > 0: switches += 'p'
+    
+    tri_in = ffi.new( 'struct triangulateio *' )
+    tri_out = ffi.new( 'struct triangulateio *' )
+    
+    tri_in.pointlist = ffi.cast( 'double *', points.ctypes.data )
+    tri_in.numberofpoints = len( points )
+    tri_in.segmentlist = ffi.cast( 'int *', boundary_edges.ctypes.data )
+    tri_in.numberofsegments = len( boundary_edges )
+    
+    ## Triangle allocates every output array we leave NULL, so we have to free them.
+    output_arrays = [ 'pointlist', 'pointattributelist', 'pointmarkerlist', 'trianglelist', 'triangleattributelist', 'neighborlist', 'segmentlist', 'segmentmarkerlist', 'edgelist', 'edgemarkerlist', 'normlist' ]
+    try:
+        libtriangle.triangulate( ffi.new( 'char[]', switches ), tri_in, tri_out, ffi.NULL )
+        
+        out_points = numpy.frombuffer( ffi.buffer( tri_out.pointlist, tri_out.numberofpoints*2*ffi.sizeof( 'double' ) ), dtype = float ).reshape( -1, 2 ).copy()
+        out_triangles = numpy.frombuffer( ffi.buffer( tri_out.trianglelist, tri_out.numberoftriangles*tri_out.numberofcorners*ffi.sizeof( 'int' ) ), dtype = numpy.intc ).reshape( -1, tri_out.numberofcorners )[:, :3].astype( int )
+    finally:
+        for name in output_arrays:
+            if getattr( tri_out, name ) != ffi.NULL:
+                libtriangle.trifree( getattr( tri_out, name ) )
+    
+    return out_points, out_triangles
 
 def __write_node_portion_of_file_to_object( obj, points, boundary_indices = set() ):
     '''
@@ -75,8 +235,13 @@ def __write_node_portion_of_file_to_object( obj, points, boundary_indices = set(
     
     print >> obj, '## The vertices'
     print >> obj, len( points ), 2, 0, len( boundary_indices )
-    for i, ( x, y ) in enumerate( points ):
-        print >> obj, i, x, y, ( 1 if i in boundary_indices else 0 )
+    ## Format the whole table with one format string, like numpy.savetxt() would, but with a single
+    ## '%' operation instead of one per line. %.17g keeps every digit of the points.
+    import numpy
+    markers = numpy.zeros( len( points ), dtype = int )
+    markers[ list( boundary_indices ) ] = 1
+    table = numpy.column_stack( ( numpy.arange( len( points ) ), points, markers ) )
+    obj.write( ( '%d %.17g %.17g %d\n' * len( points ) ) % tuple( table.ravel().tolist() ) )
 
 def write_poly_file( points, boundary_edges ):
     '''
@@ -114,8 +279,9 @@ def write_poly_file( points, boundary_edges ):
     print >> poly_file, ''
     print >> poly_file, '## The segments'
     print >> poly_file, len( boundary_edges ), len( boundary_edges )
-    for i, ( e0, e1 ) in enumerate( boundary_edges ):
-        print >> poly_file, i, e0, e1, 1
+    import numpy
+    table = numpy.column_stack( ( numpy.arange( len( boundary_edges ) ), asarray( boundary_edges, dtype = int ).reshape( -1, 2 ) ) )
+    poly_file.write( ( '%d %d %d 1\n' * len( boundary_edges ) ) % tuple( table.ravel().tolist() ) )
     
     print >> poly_file, ''
     print >> poly_file, '## The holes'
@@ -146,54 +312,68 @@ def write_node_file( points ):
     node_file.close()
     return node_file_name
 
-def read_ele_file( ele_path ):
+def read_triangle_file( path ):
     '''
-    Reads a '.ele' file generated by 'triangle'.
-    Returns the list of triangles as indices into the
-    corresponding '.node' file.
+    Reads a '.node' or '.ele' file generated by 'triangle'.
+    Returns an array with a row for each line after the header,
+    whose first column is the line's index.
     '''
     
-    ele_file = open( ele_path )
+    import numpy, re
     
-    ## Ignore top line.
-    ele_file.readline()
+    with open( path ) as f:
+        text = f.read()
     
-    triangles = []
-    for line in ele_file:
-        sline = line.strip().split()
-        if len( sline ) == 0: continue
-        if sline[0][0] == '#': continue
-        
-        triangles.append( tuple([ int( index ) for index in sline[1:4] ]) )
-        assert len( triangles[-1] ) == 3
+    ## Strip the comments, then parse every number in the file with one call.
+    text = re.sub( '#[^\n]*', '', text )
+    header, body = text.lstrip().split( '\n', 1 )
+    count = int( header.split()[0] )
     
-    ele_file.close()
+    values = numpy.fromstring( body, sep = ' ' )
+    if count == 0: return values.reshape( 0, 0 )
+    assert len( values ) % count == 0
+    return values.reshape( count, -1 )
+
+def read_ele_file( ele_path ):
+    '''
+    Reads a '.ele' file generated by 'triangle'.
+    Returns an M-by-3 numpy.array of triangles as indices into the
+    corresponding '.node' file.
+    '''
     
-    return triangles
+    return read_triangle_file( ele_path )[:,1:4].astype( int )
 
 def read_node_file( node_path ):
     '''
     Reads a '.node' file generated by 'triangle'.
-    Returns the list of points as tuples.
+    Returns a numpy.array with a row for each point:
+    the x and y position followed by the point's attributes and boundary marker, if any.
     '''
     
-    node_file = open( node_path )
-    
-    ## Ignore top line.
-    node_file.readline()
+    return read_triangle_file( node_path )[:,1:4]
+
+def test_vertex_budget( vertex_budget = 5000 ):
+    '''
+    Meshes a disc at very different scales with the maximum area from
+    triangle_options_for_vertex_budget() and checks that the number of vertices
+    stays near 'vertex_budget' at every scale.
+    '''
     
-    triangles = []
-    for line in node_file:
-        sline = line.strip().split()
-        if len( sline ) == 0: continue
-        if sline[0][0] == '#': continue
-        
-        triangles.append( tuple([ float( index ) for index in sline[1:4] ]) )
-        #assert len( triangles[-1] ) == 3
+    import numpy
     
-    node_file.close()
+    n = 200
+    angles = numpy.linspace( 0, 2*numpy.pi, n, endpoint = False )
+    edges = [ ( i, ( i+1 ) % n ) for i in xrange( n ) ]
     
-    return triangles
+    for scale in [ 1e-3, .5, 1., 300., 3e4, 1e5, 1e7 ]:
+        pts = numpy.c_[ numpy.cos( angles ), numpy.sin( angles ) ] * scale/2
+        options = triangle_options_for_vertex_budget( pts, vertex_budget )
+        assert 'e' not in options[-1]
+        
+        points, triangles = triangles_for_points( pts, edges, options )
+        print 'scale:', scale, 'options:', options, 'vertices:', len( points )
+        ## The disc fills pi/4 of its bounding box, and the mesh has a little under one vertex per maximum area.
+        assert .25*vertex_budget < len( points ) < vertex_budget
 
 # def main():
 #     pts = [ ( -1,-1 ), ( 1, -1 ), ( 1, 1 ), ( -1, 1 ), ( 0, 0 ) ]
@@ -216,3 +396,5 @@ def read_node_file( node_path ):
 #     print 'triangles (with edges):', triangles
 # 
 # if __name__ == '__main__': main()
+
+if __name__ == '__main__': test_vertex_budget()
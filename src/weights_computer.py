@@ -3,6 +3,10 @@ from triangle import *
 from bbw_wrapper import bbw
 from itertools import izip as zip
 from tictoc import tic, toc
+from collections import OrderedDict
+import os
+import triangle
+import parameters
 
 # kEnableBBW = True
 kBarycentricProjection = False
@@ -12,31 +16,41 @@ def uniquify_points_and_return_input_index_to_unique_index_map( pts, threshold =
 	Given a sequence of N points 'pts',
 	and an optional 'threshold' indicating how many decimal places of accuracy (default: 0)
 	returns two items:
-	   a sequence of all the unique elements in 'pts'
+	   a numpy.array of all the unique elements in 'pts', in the order they first appear,
 	   and
-	   a list of length N where the i-th item in the list tells you where
+	   a length N numpy.array of integers where the i-th item tells you where
 	   pts[i] can be found in the unique elements.
+	
+	Points are the same if they are the same after rounding to 'threshold' decimal places.
+	The first of the points that round the same is the one returned.
 	'''
 	
-	from collections import OrderedDict
-	unique_pts = OrderedDict()
-	pts_map = []
-	## Add rounded points to a dictionary and set the key to
-	## ( the index into the ordered dictionary, the non-rounded point )
-	for i, ( pt, rounded_pt ) in enumerate( zip( pts, map( tuple, asarray( pts ).round( threshold ) ) ) ):
-		index = unique_pts.setdefault( rounded_pt, ( len( unique_pts ), pt ) )[0]
-		## For fancier schemes:
-		# index = unique_pts.setdefault( rounded_pt, ( len( unique_pts ), [] ) )[0]
-		# unique_pts[ rounded_pt ][1].append( pt )
-		pts_map.append( index )
+	pts = asarray( pts )
+	if len( pts ) == 0:
+		return pts, zeros( 0, dtype = int )
+	
+	## Adding zero turns -0. into 0., so that they compare the same, as they would as dictionary keys.
+	rounded = asarray( pts, dtype = float ).reshape( len( pts ), -1 ).round( threshold ) + 0.
+	
+	## Sort the rounded points, so that equal ones are next to each other.
+	## lexsort() is stable, so the first of each run of equal points is its first occurrence in 'pts'.
+	order = lexsort( rounded.T[::-1] )
+	sorted_rounded = rounded[ order ]
+	starts = concatenate( ( [True], ( sorted_rounded[1:] != sorted_rounded[:-1] ).any( axis = 1 ) ) )
+	
+	## Number the runs in order of their first occurrence in 'pts'.
+	run_of_sorted = cumsum( starts ) - 1
+	first_occurrence = order[ starts ]
+	run_order = argsort( first_occurrence )
+	run_index = empty( len( run_order ), dtype = int )
+	run_index[ run_order ] = arange( len( run_order ) )
+	
+	pts_map = empty( len( pts ), dtype = int )
+	pts_map[ order ] = run_index[ run_of_sorted ]
 	
 	## Return the original resolution points.
-	## The average of all points that round:
-	# return [ tuple( average( pt, axis = 0 ) ) for i, pt in unique_pts.itervalues() ], pts_map
-	## The closest point to the rounded point:
-	# return [ tuple( pt[ abs( asarray( pt ).round( threshold ) - asarray( pt ) ).sum(axis=1).argmin() ] ) for i, pt in unique_pts.itervalues() ], pts_map
 	## Simplest, the first rounded point:
-	return [ tuple( pt ) for i, pt in unique_pts.itervalues() ], pts_map
+	return pts[ first_occurrence[ run_order ] ], pts_map
 
 def barycentric_projection( vs, faces, boundary_edges, weights, pts ):
 	'''
@@ -73,7 +87,8 @@ def barycentric_projection( vs, faces, boundary_edges, weights, pts ):
 	
 	tic( 'Barycentric projection...' )
 	
-	from raytri import raytri
+	from raytri.point_location import prepare_mesh2d_point_location, points2d_in_mesh2d_barycentric
+	from raytri.edge_distances import min_distanceSqr_edge_t_to_edges
 	
 	pts = asarray( pts )
 	
@@ -92,42 +107,35 @@ def barycentric_projection( vs, faces, boundary_edges, weights, pts ):
 		unique_pts = pts
 		unique_map = range(len( pts ))
 	
+	vs = asarray( vs )
+	faces = asarray( faces, dtype = int )
+	weights = asarray( weights )
+	boundary_edges = asarray( boundary_edges, dtype = int ).reshape( -1, 2 )
 	
-	edges = zeros( ( len( boundary_edges ), 2, len( vs[0] ) ) )
-	for bi, ( e0, e1 ) in enumerate( boundary_edges ):
-		edges[ bi ] = vs[ e0 ], vs[ e1 ]
+	## edges has dimensions #edges x 2 endpoints x 2 coordinates (x,y)
+	edges = vs[ boundary_edges ][ ..., :2 ]
 	
 	## Using vertex positions as weights should lead to the
 	## identity transformation. (See comment d987dsa98d7h below.)
 	# weights = array( vs )
 	
-	misses = 0
-	misses_total_distance = 0.
-	misses_max_distance = -31337.
-	unique_weights = zeros( ( len( unique_pts ), len( weights[0] ) ) )
-	for pi, pt in enumerate( unique_pts ):
-		bary = raytri.point2d_in_mesh2d_barycentric( pt, vs, faces )
-		## Did we hit the mesh?
-		if bary is not None:
-			fi, ( b0, b1, b2 ) = bary
-			#assert abs( b0 + b1 + b2 - 1 ) < 1e-5
-			#assert b0 > -1e-5
-			#assert b1 > -1e-5
-			#assert b2 > -1e-5
-			#assert b0 < 1+1e-5
-			#assert b1 < 1+1e-5
-			#assert b2 < 1+1e-5
-			unique_weights[pi] = b0*weights[ faces[ fi ][0] ] + b1*weights[ faces[ fi ][1] ] + b2*weights[ faces[ fi ][2] ]
-		else:
-			#print 'pi outside:', pi
-			dist, ei, t = raytri.closest_distsqr_and_edge_index_and_t_on_edges_to_point( edges, pt )
-			#assert t > -1e-5
-			#assert t < 1+1e-5
-			dist = sqrt( dist )
-			misses += 1
-			misses_total_distance += dist
-			misses_max_distance = max( misses_max_distance, dist )
-			unique_weights[pi] = (1-t)*weights[ boundary_edges[ ei ][0] ] + t*weights[ boundary_edges[ ei ][1] ]
+	## Locate all the points in the mesh at once.
+	mesh = prepare_mesh2d_point_location( vs[:, :2], faces )
+	fis, barys = points2d_in_mesh2d_barycentric( unique_pts[:, :2], mesh )
+	
+	unique_weights = zeros( ( len( unique_pts ), weights.shape[1] ) )
+	hits = where( fis >= 0 )[0]
+	unique_weights[ hits ] = einsum( 'pk,pkh->ph', barys[ hits ], weights[ faces[ fis[ hits ] ] ] )
+	
+	## The points that missed the mesh get the weights of the closest point on the boundary.
+	misses = where( fis < 0 )[0]
+	if len( misses ) > 0:
+		dists, eis, ts = min_distanceSqr_edge_t_to_edges( unique_pts[ misses, :2 ], edges )
+		dists = sqrt( dists )
+		unique_weights[ misses ] = (1-ts)[:,newaxis]*weights[ boundary_edges[ eis, 0 ] ] + ts[:,newaxis]*weights[ boundary_edges[ eis, 1 ] ]
+		misses_total_distance = dists.sum()
+		misses_max_distance = dists.max()
+	misses = len( misses )
 	
 	## And indeed it does come out nearly identical. (See comment d987dsa98d7h above.)
 	# assert ( unique_weights - pts ).allclose()
@@ -153,12 +161,19 @@ def flatten_paths( all_pts ):
 	'''
 	Given a sequence of paths, each of which is a sequence of chains, each of which is a sequence of points,
 	return the points as a flat sequence with a list of chain shapes (length of chain, number of points in each piece of chain).
+	The pieces of a chain may have different numbers of points, in which case
+	the number of points in each piece of chain is a tuple with one entry per piece.
 	'''
 	
-	all_pts = asarray( all_pts )
-	all_shapes = [ asarray( pts ).shape[:-1] for pts in all_pts ]
+	all_shapes = []
+	for path_pts in all_pts:
+		counts = tuple( len( pts ) for pts in path_pts )
+		if len( set( counts ) ) <= 1:
+			all_shapes.append( ( len( counts ), counts[0] if len( counts ) > 0 else 0 ) )
+		else:
+			all_shapes.append( ( len( counts ), counts ) )
 	
-	all_new_pts = concatenate( [ concatenate( path_pts ) for path_pts in all_pts ] )
+	all_new_pts = concatenate( [ concatenate( [ asarray( pts ) for pts in path_pts ] ) for path_pts in all_pts ] )
 
 	return all_new_pts, all_shapes
 
@@ -172,10 +187,11 @@ def unflatten_data( flattened, all_shapes ):
 	all_maps = []
 	pos = 0
 	for shape in all_shapes:
+		counts = shape[1] if isinstance( shape[1], tuple ) else ( shape[1], ) * shape[0]
 		maps = []
-		for j in range( shape[0] ):
-			maps.append( flattened[ pos : pos + shape[1] ] )
-			pos += shape[1]
+		for count in counts:
+			maps.append( flattened[ pos : pos + count ] )
+			pos += count
 		all_maps.append( maps )
 	
 	return all_maps
@@ -272,6 +288,95 @@ def compute_all_weights_mvc( all_pts, cage_loop ):
 	
 	return all_pts, all_weights, all_maps
 
+## The most recently used cached weights, from cached_weights_key() to a dictionary of arrays.
+_weights_cache = OrderedDict()
+
+def cached_weights_key( which, all_pts, all_shapes, skeleton_handle_vertices, boundary_index, triangle_options ):
+	'''
+	Given the name of a weight function 'which' and the arguments passed to it
+	(with 'all_pts' and 'all_shapes' as returned by flatten_paths()),
+	and the options it passes to 'triangle',
+	returns a hex string that identifies its result.
+	The key covers everything the triangulation and weights depend on.
+	'''
+	import hashlib
+	
+	key = hashlib.sha1()
+	key.update( repr( ( which, boundary_index, [ tuple( shape ) for shape in all_shapes ], list( triangle_options ), kBarycentricProjection ) ) )
+	key.update( ascontiguousarray( all_pts, dtype = float ).tostring() )
+	key.update( ascontiguousarray( skeleton_handle_vertices, dtype = float ).tostring() )
+	return key.hexdigest()
+
+def load_cached_weights( key ):
+	'''
+	Returns the dictionary of arrays stored with store_cached_weights() under 'key',
+	or None if there is none in memory or in parameters.kWeightsCacheDirectory.
+	'''
+	
+	if key in _weights_cache:
+		## Mark it as the most recently used.
+		entry = _weights_cache.pop( key )
+		_weights_cache[ key ] = entry
+		return entry
+	
+	if parameters.kWeightsCacheDirectory is None: return None
+	
+	path = os.path.join( parameters.kWeightsCacheDirectory, key + '.npz' )
+	if not os.path.exists( path ): return None
+	
+	try:
+		with load( path ) as npz:
+			entry = dict( npz.items() )
+	except Exception as e:
+		print 'Ignoring unreadable cached weights:', path, e
+		return None
+	
+	store_cached_weights( key, entry, write = False )
+	return entry
+
+def store_cached_weights( key, entry, write = True ):
+	'''
+	Stores the dictionary of arrays 'entry' under 'key', evicting the least recently used
+	entries beyond parameters.kWeightsCacheSize.
+	If 'write' is True and parameters.kWeightsCacheDirectory is not None,
+	also saves it there as an .npz file.
+	'''
+	
+	_weights_cache.pop( key, None )
+	_weights_cache[ key ] = entry
+	while len( _weights_cache ) > max( parameters.kWeightsCacheSize, 0 ):
+		_weights_cache.popitem( last = False )
+	
+	if not write or parameters.kWeightsCacheDirectory is None: return
+	
+	import tempfile
+	if not os.path.isdir( parameters.kWeightsCacheDirectory ):
+		os.makedirs( parameters.kWeightsCacheDirectory )
+	## Write to a temporary file and then rename it, so that a concurrent reader
+	## never sees a partially written file.
+	fd, tmp_path = tempfile.mkstemp( suffix = '.npz', dir = parameters.kWeightsCacheDirectory )
+	try:
+		with os.fdopen( fd, 'wb' ) as f:
+			savez( f, **entry )
+		os.rename( tmp_path, os.path.join( parameters.kWeightsCacheDirectory, key + '.npz' ) )
+	except:
+		os.remove( tmp_path )
+		raise
+
+def weights_from_cached_entry( entry, all_shapes, customized = False ):
+	'''
+	Given a dictionary of arrays 'entry' stored by compute_all_weights_bbw() with store_cached_weights()
+	and the 'all_shapes' of its points as returned by flatten_paths(),
+	returns what compute_all_weights_bbw() returns for it.
+	The arrays are copies, so callers can modify them without changing the cache.
+	'''
+	all_maps = unflatten_data( entry['maps'].tolist(), all_shapes )
+	if customized == False:
+		return entry['vs'].copy(), entry['weights'].copy(), all_maps
+	## for the test of naive approaches.
+	else:
+		return entry['vs'].copy(), entry['faces'].copy(), [ tuple( edge ) for edge in entry['boundary_edges'].tolist() ], entry['weights'].copy(), all_maps
+
 def compute_all_weights_bbw( all_pts, skeleton_handle_vertices, boundary_index, customized = False ):
 	'''
 	triangulate a region closed by a bunch of bezier curves if needed, and precompute the vertices at each sample point.
@@ -290,12 +395,22 @@ def compute_all_weights_bbw( all_pts, skeleton_handle_vertices, boundary_index,
 	
 	all_pts, all_shapes = flatten_paths( all_pts )
 	
+	## Choose the maximum triangle area from the size of the drawing.
+	options = triangle_options_for_vertex_budget( concatenate( ( asarray( skeleton_handle_vertices )[:, :2], all_pts[:, :2] ), axis = 0 ), parameters.kTriangleVertexBudget )
+	
+	## The triangulation and weights only depend on the inputs, so look for them in the cache first.
+	key = cached_weights_key( 'bbw', all_pts, all_shapes, skeleton_handle_vertices, boundary_index, options )
+	cached = load_cached_weights( key )
+	if cached is not None:
+		return weights_from_cached_entry( cached, all_shapes, customized )
+	
 	tic( 'Removing duplicate points...' )
 	## NOTE: The handles must be in here, because if we add them later we might end up with duplicate points.
 	all_clean_pts, pts_maps = uniquify_points_and_return_input_index_to_unique_index_map( concatenate( ( skeleton_handle_vertices, all_pts ), axis = 0 ), threshold = 0 )
 	toc()
 	
-	all_maps = unflatten_data( pts_maps[len(skeleton_handle_vertices):], all_shapes )
+	flat_maps = pts_maps[len(skeleton_handle_vertices):]
+	all_maps = unflatten_data( flat_maps, all_shapes )
 	all_clean_pts = asarray( all_clean_pts )[:, :2]
 	
 	## This will store a sequence of tuples ( edge_start_index, edge_end_index ).
@@ -344,23 +459,28 @@ def compute_all_weights_bbw( all_pts, skeleton_handle_vertices, boundary_index,
 		boundary_edges.append( ( boundary_vertex_indices[i], boundary_vertex_indices[ (i+1) % len(boundary_vertex_indices) ] ) )
 	
 	tic( 'Computing triangulation...' )
-	vs, faces = triangles_for_points( all_clean_pts, boundary_edges )
+	vs, faces = triangles_for_points( all_clean_pts, boundary_edges, options )
 	toc()
 	
 	vs = asarray(vs)[:, :2] 
 	faces = asarray(faces)
+	print 'Triangle mesh:', len( vs ), 'vertices and', len( faces ), 'triangles with options', ' '.join( options )
 	
 	skeleton_handle_vertices = asarray( skeleton_handle_vertices )[:, :2]
 	skeleton_point_handles = list( range( len(skeleton_handle_vertices) ) )
 	
 	tic( 'Computing BBW...' )
-	all_weights = bbw.bbw(vs, faces, skeleton_handle_vertices, skeleton_point_handles)
+	column_seconds = []
+	all_weights = bbw.bbw(vs, faces, skeleton_handle_vertices, skeleton_point_handles, parameters.kBBWThreads, column_seconds)
 	toc()
+	if len( column_seconds ) > 0:
+		print 'BBW seconds per handle:', ', '.join([ '%.3f' % seconds for seconds in column_seconds ])
 	
 	if kBarycentricProjection:
 		if __debug__: old_weights = asarray([ all_weights[i] for i in pts_maps ])
 		
 		vs, all_weights, pts_maps = barycentric_projection( vs, faces, boundary_edges, all_weights, all_pts )
+		flat_maps = pts_maps
 		all_maps = unflatten_data( pts_maps, all_shapes )
 		
 		if __debug__:
@@ -368,11 +488,17 @@ def compute_all_weights_bbw( all_pts, skeleton_handle_vertices, boundary_index,
 			total_weight_change = abs(old_weights-new_weights).sum()
 			print 'Barycentric projection led to an average change in weights of', total_weight_change/prod( new_weights.shape ), 'and a total change of', total_weight_change
 	
-	if customized == False:
-		return vs, all_weights, all_maps
-	## for the test of naive approaches.
-	else:
-		return vs, faces, boundary_edges, all_weights, all_maps
+	entry = {
+		'vs': asarray( vs ),
+		'faces': asarray( faces ),
+		'boundary_edges': asarray( boundary_edges, dtype = int ).reshape( -1, 2 ),
+		'weights': asarray( all_weights ),
+		'maps': asarray( flat_maps, dtype = int )
+		}
+	store_cached_weights( key, entry )
+	
+	## Return the same types (and copies) as a cache hit would.
+	return weights_from_cached_entry( entry, all_shapes, customized )
 
 def compute_all_weights_harmonic( all_pts, skeleton_handle_vertices, customized = False ):
 	'''
@@ -406,11 +532,13 @@ def compute_all_weights_harmonic( all_pts, skeleton_handle_vertices, customized
 	assert len(set( boundary_edges )) == len( boundary_edges )
 	
 	tic( 'Computing triangulation...' )
-	vs, faces = triangles_for_points( all_clean_pts, boundary_edges )
+	options = triangle_options_for_vertex_budget( all_clean_pts, parameters.kTriangleVertexBudget )
+	vs, faces = triangles_for_points( all_clean_pts, boundary_edges, options )
 	toc()
 	
 	vs = asarray(vs)[:, :2] 
 	faces = asarray(faces)
+	print 'Triangle mesh:', len( vs ), 'vertices and', len( faces ), 'triangles with options', ' '.join( options )
 	
 	tic( 'Computing Harmonic Coordinates...' )
 	all_weights = bbw.harmonic( vs, faces, [ i for i,j in boundary_edges ], 1 )
@@ -468,6 +596,20 @@ def shepard_fast( vs, skeleton_handle_vertices ):
 	>>> abs( shepard_fast( vs, skeleton_handle_vertices ) - shepard( vs, skeleton_handle_vertices ) ).max()
 	'''
 	
+	return shepard_from_distances( shepard_distances( vs, skeleton_handle_vertices ) )
+
+def shepard_distances( vs, skeleton_handle_vertices, previous_handle_vertices = None, previous_distances = None ):
+	'''
+	Given an N-by-(2 or 3) sequence 'vs' of 2D or 3D vertices and
+	an H-by-(2 or 3) sequence 'skeleton_handle_vertices' of 2D or 3D vertices,
+	returns a N-by-H numpy.array of the squared distance from each vertex to each handle.
+	
+	Each column only depends on its own handle, so if the optional
+	'previous_handle_vertices' and the 'previous_distances' computed for them
+	(with the same 'vs') are given, the columns of handles that didn't move are
+	copied rather than recomputed.
+	'''
+	
 	vs = asarray( vs )
 	skeleton_handle_vertices = asarray( skeleton_handle_vertices )
 	
@@ -475,10 +617,33 @@ def shepard_fast( vs, skeleton_handle_vertices ):
 	assert len( skeleton_handle_vertices.shape ) == 2
 	assert vs.shape[1] == skeleton_handle_vertices.shape[1]
 	
-	diffs = (skeleton_handle_vertices[newaxis,...] - vs[:,newaxis,:])
-	diffs = ( diffs**2 ).sum( -1 )
-	## 'diffs' is N-by-H
+	## Map each previous handle position to its column.
+	previous_columns = {}
+	if previous_handle_vertices is not None:
+		for hi, h in enumerate( asarray( previous_handle_vertices ) ):
+			previous_columns.setdefault( tuple( h ), hi )
+	
+	diffs = empty( ( len( vs ), len( skeleton_handle_vertices ) ) )
+	changed = []
+	for hi, h in enumerate( skeleton_handle_vertices ):
+		if tuple( h ) in previous_columns:
+			diffs[ :, hi ] = previous_distances[ :, previous_columns[ tuple( h ) ] ]
+		else:
+			changed.append( hi )
+	
+	if len( changed ) > 0:
+		changed_diffs = (skeleton_handle_vertices[newaxis,changed] - vs[:,newaxis,:])
+		diffs[ :, changed ] = ( changed_diffs**2 ).sum( -1 )
 	
+	return diffs
+
+def shepard_from_distances( diffs ):
+	'''
+	Given the N-by-H squared distances 'diffs' returned by shepard_distances(),
+	returns a N-by-H numpy.array of weights per vertex per handle.
+	'''
+	
+	## 'diffs' is N-by-H
 	small = diffs < 1e-8
 	
 	## NOTE: Shepard weights could allow one to take this to a power other than 2,
@@ -493,6 +658,41 @@ def shepard_fast( vs, skeleton_handle_vertices ):
 	
 	return diffs
 
+def shepard_gradients( vs, skeleton_handle_vertices ):
+	'''
+	Given an N-by-2 sequence 'vs' of 2D vertices and
+	an H-by-2 sequence 'skeleton_handle_vertices' of 2D vertices,
+	returns a N-by-H-by-2 numpy.array of the derivative of each vertex's
+	shepard() weight for each handle with respect to the vertex's x and y.
+	The derivatives at a vertex on top of a handle are all zero.
+	'''
+	
+	vs = asarray( vs )
+	skeleton_handle_vertices = asarray( skeleton_handle_vertices )
+	
+	assert len( vs.shape ) == 2
+	assert len( skeleton_handle_vertices.shape ) == 2
+	assert vs.shape[1] == skeleton_handle_vertices.shape[1]
+	
+	## 'seps' is N-by-H-by-2 and 'diffs' is N-by-H.
+	seps = vs[:,newaxis,:] - skeleton_handle_vertices[newaxis,:,:]
+	diffs = ( seps**2 ).sum( -1 )
+	
+	## The derivatives are zero at vertices too close to a handle.
+	on_handle = ( abs( diffs ) < 1e-7 ).any( 1 )
+	diffs[ on_handle ] = 1.
+	
+	## The un-normalized weights are u_i = 1/|p-h_i|^2, whose derivative is du_i = -2(p-h_i)/|p-h_i|^4.
+	## The derivative of w_i = u_i / sum_j u_j is du_i / sum_j u_j - u_i sum_j du_j / (sum_j u_j)^2.
+	us = 1./diffs
+	dus = -2.*seps / ( diffs**2 )[...,newaxis]
+	us_sum = us.sum( 1 )[:,newaxis,newaxis]
+	derivatives = dus / us_sum - us[...,newaxis] * dus.sum( 1 )[:,newaxis,:] / us_sum**2
+	
+	derivatives[ on_handle ] = 0.
+	
+	return derivatives
+
 shepard = shepard_fast
 
 def precompute_W_i( vs, weights, i, sampling_index2vs_index, sampling, ts, dts ):
@@ -560,6 +760,78 @@ def precompute_W_i_fast( vs, weights, i, sampling_index2vs_index, sampling, ts,
 
 precompute_W_i = precompute_W_i_fast
 
+def precompute_W_sample_factors( all_indices, all_ts, all_dts ):
+	'''
+	Given, for each path, the 'sampling_index2vs_index', 'ts', and 'dts' of each of its curves
+	(as would be passed to precompute_W_i(), or with one dt per sample for Gauss-Legendre quadrature),
+	returns the part of precompute_all_W_fast() that doesn't depend on the weights,
+	so that it can be passed back in when only the weights change.
+	'''
+	num_curves = [ len( path_indices ) for path_indices in all_indices ]
+	if sum( num_curves ) == 0:
+		return num_curves, 0, []
+	
+	## Flatten the curves of all paths.
+	indices = [ asarray( curve_indices, dtype = int ) for path_indices in all_indices for curve_indices in path_indices ]
+	ts = [ asarray( curve_ts, dtype = float ) for path_ts in all_ts for curve_ts in path_ts ]
+	dts = [ asarray( curve_dts, dtype = float ) for path_dts in all_dts for curve_dts in path_dts ]
+	
+	## The quadrature points of each curve, and the vertices of the two samples
+	## whose weights are averaged there.
+	quadrature = [ quadrature_points( curve_ts, curve_dts ) for curve_ts, curve_dts in zip( ts, dts ) ]
+	
+	## The curves with the same number of quadrature points are stacked together,
+	## so that no curve's arrays are padded to the length of a much longer one.
+	counts = asarray([ len( curve_quadrature[0] ) for curve_quadrature in quadrature ])
+	groups = []
+	for count in unique( counts ):
+		curves = where( counts == count )[0]
+		first_indices = array([ indices[k][ quadrature[k][2] ] for k in curves ])
+		second_indices = array([ indices[k][ quadrature[k][3] ] for k in curves ])
+		qts = array([ quadrature[k][0] for k in curves ])
+		qdts = array([ quadrature[k][1] for k in curves ])
+		
+		tbars = concatenate( ( qts[ ..., newaxis ]**3, qts[ ..., newaxis ]**2, qts[ ..., newaxis ], ones( qts.shape + ( 1, ) ) ), axis = 2 )
+		C_P = dot( tbars, asarray( M ).T )
+		
+		## factors[k,s] = qdts[k,s] * outer( tbars[k,s], C_P[k,s] )
+		factors = einsum( 'ks,ksa,ksb->ksab', qdts, tbars, C_P )
+		
+		groups.append( ( curves, first_indices, second_indices, factors ) )
+	
+	return num_curves, len( quadrature ), groups
+
+def precompute_all_W_fast( weights, all_indices, all_ts, all_dts, sample_factors = None ):
+	'''
+	Given an N-by-num-handles numpy.array 'weights' of all the weights for each sample vertex,
+	and, for each path, the 'sampling_index2vs_index', 'ts', and 'dts' of each of its curves
+	(as would be passed to precompute_W_i() ),
+	returns a list with a num-curves-by-num-handles-by-4-by-4 numpy.array for each path,
+	whose [k,i] entry is precompute_W_i() for curve k and handle i.
+	
+	All curves of all paths with the same number of quadrature points
+	are computed together with a few batched products.
+	If the optional 'sample_factors' returned by precompute_W_sample_factors()
+	for the same sampling is given, it is used instead of being recomputed.
+	'''
+	weights = asarray( weights )
+	if sample_factors is None:
+		sample_factors = precompute_W_sample_factors( all_indices, all_ts, all_dts )
+	num_curves, total_curves, groups = sample_factors
+	if sum( num_curves ) == 0:
+		return [ zeros( ( 0, weights.shape[1], 4, 4 ) ) for path_indices in all_indices ]
+	
+	W = empty( ( total_curves, weights.shape[1], 4, 4 ) )
+	for curves, first_indices, second_indices, factors in groups:
+		## The weights at each quadrature point are the average of the weights of its two samples,
+		## which are the same sample for Gauss-Legendre quadrature and consecutive ones for the midpoint rule.
+		wavg = .5*( weights[ first_indices ] + weights[ second_indices ] )
+		
+		## W[k,i] = sum_s wavg[k,s,i] * factors[k,s]
+		W[ curves ] = einsum( 'ksi,ksab->kiab', wavg, factors )
+	
+	return split( W, cumsum( num_curves )[:-1] )
+
 def precompute_W_i_with_weight_function_and_sampling( weight_function, sampling, ts, dts ):
 	'''
 	R = sum( T_i * P.T * M * partofR ) 
@@ -680,7 +952,8 @@ def compute_error_metric( target_path, deformed_path, path_dts, lengths ):
 		target_curve = asarray( target_curve ).reshape( -1, 2 )
 		deformed_curve = asarray( deformed_curve ).reshape( -1, 2)
 		dists = ( ( deformed_curve - target_curve )**2 ).sum( axis = 1 )
-		dists = (dists[:-1] + dists[1:])/2
+		qts, qdts, first, second = quadrature_points( linspace( 0, 1, len( dists ) ), segment_dts )
+		dists = (dists[first] + dists[second])/2
 	
 		energy.append( dot( dists, segment_dts )*length )
 	